@@ -1,11 +1,17 @@
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from django.urls import path, reverse
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.html import format_html
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.db import transaction
+from . import order_status
+from .assignment import auto_assign_products
+from .exports import EXPORT_FORMATS, export_products_response
 from .forms import CourierCreationForm, ProductForm, ExcelImportForm
-from .utils import import_products_from_excel
-from .models import User, Region, City, Courier, Product, ProductImage
+from .jobs import submit_import_job
+from .models import User, Region, City, Courier, Product, ProductImage, ImportJob, ImportJournal
 from .filter import AssignedFilter
 
 # Import custom admin site
@@ -127,6 +133,7 @@ class ProductAdmin(admin.ModelAdmin):
         'longitude',
     ]
     list_filter = ['order_status', 'region', 'city', AssignedFilter]
+    list_select_related = ['city', 'region', 'assigned_to__user']
     search_fields = ['order_number', 'name']
     list_editable = ['order_status', 'assigned_to']
     fields = (
@@ -143,6 +150,7 @@ class ProductAdmin(admin.ModelAdmin):
     )
     raw_id_fields = ('city', 'region')  # Note: Do not include assigned_to here so that the DAL widget is used.
     inlines = [ProductImageInline]
+    actions = ['export_selected_csv', 'export_selected_xlsx', 'auto_assign_selected']
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -166,17 +174,53 @@ class ProductAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('import-excel/', self.admin_site.admin_view(self.import_excel), name='product_upload_excel'),
+            path('import-excel/<int:job_id>/', self.admin_site.admin_view(self.import_status),
+                 name='product_import_status'),
+            path('export/<str:file_format>/', self.admin_site.admin_view(self.export_products),
+                 name='product_export'),
         ]
         return custom_urls + urls
 
+    def export_products(self, request, file_format):
+        """
+        Exports every product the changelist shows with the current filters and search.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if file_format not in EXPORT_FORMATS:
+            raise Http404
+        queryset = self.get_changelist_instance(request).get_queryset(request)
+        return export_products_response(queryset, file_format)
+
+    @admin.action(description="Export selected products as CSV")
+    def export_selected_csv(self, request, queryset):
+        return export_products_response(queryset, 'csv')
+
+    @admin.action(description="Export selected products as XLSX")
+    def export_selected_xlsx(self, request, queryset):
+        return export_products_response(queryset, 'xlsx')
+
+    @admin.action(description="Auto-assign selected unassigned products to couriers")
+    def auto_assign_selected(self, request, queryset):
+        result = auto_assign_products(queryset)
+        self.message_user(
+            request,
+            f"Assigned {result['assigned']} product(s) to {result['couriers']} courier(s); "
+            f"{result['uncovered']} product(s) have no courier covering their city.",
+            level=messages.WARNING if result['uncovered'] else messages.SUCCESS,
+        )
+
     def import_excel(self, request):
         if request.method == "POST":
             form = ExcelImportForm(request.POST, request.FILES)
             if form.is_valid():
-                excel_file = form.cleaned_data["excel_file"]
-                result_messages = import_products_from_excel(excel_file)
-                self.message_user(request, "Import completed: " + " ".join(result_messages))
-                return redirect("..")
+                job = ImportJob.objects.create(
+                    file=form.cleaned_data["excel_file"],
+                    upsert=form.cleaned_data["update_existing"],
+                    created_by=request.user,
+                )
+                submit_import_job(job)
+                return redirect("admin:product_import_status", job_id=job.pk)
         else:
             form = ExcelImportForm()
         context = dict(
@@ -185,6 +229,15 @@ class ProductAdmin(admin.ModelAdmin):
         )
         return render(request, "admin/products/import_excel.html", context)
 
+    def import_status(self, request, job_id):
+        job = get_object_or_404(ImportJob.objects.visible_to(request.user), pk=job_id)
+        context = dict(
+            self.admin_site.each_context(request),
+            job=job,
+            status_url=reverse("import-job-detail", args=(job.pk,)),
+        )
+        return render(request, "admin/products/import_status.html", context)
+
     def assigned_to_display(self, obj):
         if obj.assigned_to:
             return format_html(
@@ -194,6 +247,32 @@ class ProductAdmin(admin.ModelAdmin):
             )
         return "-"
 
+    def save_product_form(self, form):
+        """
+        Saves the changes of a bound ProductForm for an existing product without writing
+        columns nobody touched: the changed fields with save(update_fields=...), and the status
+        through the state machine, as a compare-and-set against the value the form was built
+        from. Raises ValueError if the status changed meanwhile.
+        """
+        product = form.instance
+        model_fields = {field.name for field in product._meta.concrete_fields}
+        update_fields = [name for name in form.changed_data if name in model_fields and name != 'order_status']
+        with transaction.atomic():
+            if update_fields:
+                product.save(update_fields=update_fields)
+            if 'order_status' in form.changed_data:
+                expected = form.initial['order_status']
+                if not order_status.transition_product(product, form.cleaned_data['order_status'], expected):
+                    raise ValueError(f"The status of {product} was changed meanwhile, please reload and retry.")
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        try:
+            self.save_product_form(form)
+        except ValueError as e:
+            self.message_user(request, str(e), level=messages.ERROR)
+
     def changelist_view(self, request, extra_context=None):
         """
         Override the changelist view to perform a partial save when the form is submitted.
@@ -217,7 +296,7 @@ class ProductAdmin(admin.ModelAdmin):
                 if form.has_changed():
                     if form.is_valid():
                         try:
-                            form.save()
+                            self.save_product_form(form)
                             saved_count += 1
                         except Exception as e:
                             error_messages[form.prefix] = str(e)
@@ -232,3 +311,28 @@ class ProductAdmin(admin.ModelAdmin):
         return super().changelist_view(request, extra_context)
 
     assigned_to_display.short_description = "Assigned Courier"
+
+
+# Import Job Admin
+@admin.register(ImportJob, site=admin_site)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_per_page = 20
+    list_display = ['id', 'file', 'upsert', 'status', 'rows_processed', 'rows_imported', 'created_by', 'created_at']
+    list_filter = ['status']
+    readonly_fields = [f.name for f in ImportJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+# Import Journal Admin (delete an entry to allow a file to be imported again from scratch)
+@admin.register(ImportJournal, site=admin_site)
+class ImportJournalAdmin(admin.ModelAdmin):
+    list_per_page = 20
+    list_display = ['file_hash', 'upsert', 'rows_committed', 'rows_imported', 'completed', 'updated_at']
+    list_filter = ['completed']
+    search_fields = ['file_hash']
+    readonly_fields = [f.name for f in ImportJournal._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
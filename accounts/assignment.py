@@ -0,0 +1,112 @@
+"""
+Automatic assignment of unassigned products to couriers.
+
+The assignment is planned in memory from one snapshot (the candidate products, which couriers
+cover which city and every courier's open workload) and written back with one UPDATE per
+courier. Each product goes to the least loaded courier covering its city, where a courier's
+load is its open parcels plus their weight in units of AUTO_ASSIGN_WEIGHT_UNIT kilograms.
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from . import order_status
+from .models import Courier, Product, next_product_revision
+
+# Product ids written back per UPDATE.
+ASSIGN_CHUNK_SIZE = 5000
+
+
+def load_assignment_snapshot(products):
+    """
+    Reads everything plan_assignment needs in three queries: the unassigned open products of
+    the queryset products as (id, city_id, weight) tuples, the couriers covering each city
+    ({city_id: [courier_id, ...]}) and the open workload of every courier
+    ({courier_id: (parcels, kilograms)}).
+    """
+    candidates = [
+        (pk, city_id, float(weight))
+        for pk, city_id, weight in products.filter(
+            assigned_to=None, order_status__in=order_status.OPEN_STATUSES,
+        ).order_by().values_list('id', 'city_id', 'weight')
+    ]
+    coverage = defaultdict(list)
+    for courier_id, city_id in Courier.covered_cities.through.objects.values_list('courier_id', 'city_id'):
+        coverage[city_id].append(courier_id)
+    loads = {
+        courier_id: (parcels, float(kilograms or 0))
+        for courier_id, parcels, kilograms in Product.objects.filter(
+            order_status__in=order_status.OPEN_STATUSES,
+        ).exclude(assigned_to=None).order_by().values('assigned_to').annotate(
+            parcels=Count('id'), kilograms=Sum('weight'),
+        ).values_list('assigned_to', 'parcels', 'kilograms')
+    }
+    return candidates, dict(coverage), loads
+
+
+def plan_assignment(candidates, coverage, loads, weight_unit=None):
+    """
+    Returns ({courier_id: [product_id, ...]}, [product_id, ...] nobody covers) for the snapshot
+    of load_assignment_snapshot. Heaviest products are placed first, each on the courier
+    with the lowest load among those covering its city, so the lighter ones even out what
+    is left. Each city keeps a heap of its couriers; entries of a courier that received work
+    in another city are stale (too low) and are refreshed when they reach the top.
+    """
+    weight_unit = weight_unit or getattr(settings, 'AUTO_ASSIGN_WEIGHT_UNIT', 5)
+    scores = {courier_id: parcels + kilograms / weight_unit for courier_id, (parcels, kilograms) in loads.items()}
+    heaps = {}
+    plan = defaultdict(list)
+    uncovered = []
+    for product_id, city_id, weight in sorted(candidates, key=lambda candidate: -candidate[2]):
+        heap = heaps.get(city_id)
+        if heap is None:
+            if not coverage.get(city_id):
+                uncovered.append(product_id)
+                continue
+            heap = heaps[city_id] = [(scores.get(courier_id, 0.0), courier_id) for courier_id in coverage[city_id]]
+            heapq.heapify(heap)
+        score, courier_id = heap[0]
+        while score != scores.get(courier_id, 0.0):
+            heapq.heapreplace(heap, (scores[courier_id], courier_id))
+            score, courier_id = heap[0]
+        scores[courier_id] = score + 1 + weight / weight_unit
+        heapq.heapreplace(heap, (scores[courier_id], courier_id))
+        plan[courier_id].append(product_id)
+    return dict(plan), uncovered
+
+
+def write_assignment(plan):
+    """
+    Writes a plan of plan_assignment back with one UPDATE per courier (and ASSIGN_CHUNK_SIZE
+    products), all under one revision. Products assigned by someone else since the snapshot
+    are left alone. Returns the number of products assigned.
+    """
+    assigned = 0
+    with transaction.atomic():
+        revision = next_product_revision()
+        for courier_id, product_ids in plan.items():
+            for start in range(0, len(product_ids), ASSIGN_CHUNK_SIZE):
+                assigned += Product.objects.filter(
+                    id__in=product_ids[start:start + ASSIGN_CHUNK_SIZE], assigned_to=None,
+                ).update(assigned_to_id=courier_id, revision=revision)
+    return assigned
+
+
+def auto_assign_products(products=None, dry_run=False, weight_unit=None):
+    """
+    Assigns the unassigned open products of the queryset products (default: all products) to
+    couriers covering their city, balancing the couriers' open workload. With dry_run nothing
+    is written. Returns a dict with the number of products assigned (or planned, with dry_run),
+    left unassigned because no courier covers their city (or they have none), and of couriers
+    that received products.
+    """
+    products = Product.objects.all() if products is None else products
+    with transaction.atomic():
+        candidates, coverage, loads = load_assignment_snapshot(products)
+        plan, uncovered = plan_assignment(candidates, coverage, loads, weight_unit)
+        planned = sum(len(product_ids) for product_ids in plan.values())
+        assigned = planned if dry_run else write_assignment(plan)
+    return {'assigned': assigned, 'uncovered': len(uncovered), 'couriers': len(plan)}
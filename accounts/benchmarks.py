@@ -0,0 +1,351 @@
+import contextlib
+import csv
+import datetime
+import io
+import itertools
+import random
+import time
+
+import openpyxl
+from django.db import connection
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+
+from .assignment import load_assignment_snapshot, plan_assignment, write_assignment
+from .filter import prefix_range
+from .models import City, Courier, Product, Region, User
+from .pagination import KeysetPagination
+from .renderers import ORJSONRenderer
+from .serializers import ProductSerializer, product_list_rows, product_list_values
+from .utils import CityMatcher, import_products_from_excel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MANIFEST_HEADER = [
+    '序号', '订单状态', '创建时间', '订单号', '重量', 'Product name', '商品名称', 'Address', 'City', 'Region', 'Phone',
+]
+
+STATUSES = ['确认订单'] * 8 + ['待确认', '已取消']
+
+PRODUCTS = [
+    ('Phone case', '手机壳'),
+    ('Wireless earbuds', '无线耳机'),
+    ('Kitchen scale', '厨房秤'),
+    ('Winter jacket', '冬季夹克'),
+    ('LED strip', 'LED灯带'),
+    ('Backpack', '背包'),
+]
+
+# Region -> cities, with the spellings seen in real manifests.
+PLACES = {
+    "Toshkent shahri": ["Yunusobod tumani", "Chilonzor tumani", "Mirzo Ulug'bek tumani", "Sergeli tumani"],
+    "Samarqand viloyati": ["Samarqand shahri", "Urgut tumani", "Kattaqo'rg'on tumani"],
+    "Buxoro viloyati": ["Buxoro shahri", "G'ijduvon tumani", "Kogon tumani"],
+    "Farg'ona viloyati": ["Farg'ona shahri", "Marg'ilon shahri", "Qo'qon shahri"],
+    "Navoiy viloyati": ["Navoiy shahri", "Zarafshon shahri"],
+}
+
+
+def misspell(rng, name):
+    """
+    Returns a near-duplicate spelling of name, as produced by different marketplace sellers.
+    """
+    variant = rng.random()
+    if variant < 0.5:
+        return name
+    if variant < 0.6:
+        return name.upper()
+    if variant < 0.7:
+        return name.lower()
+    if variant < 0.8:
+        return name.replace("'", "")
+    if variant < 0.9:
+        return name.replace(" tumani", " tuman").replace(" shahri", " sh.")
+    position = rng.randrange(len(name))
+    return name[:position] + name[position + 1:]
+
+
+def generate_manifest_rows(rows, seed=0, duplicate_rate=0.1):
+    """
+    Yields rows of a synthetic manifest in the column layout of import_products_from_excel:
+    Chinese status strings, comma decimal weights, 'Region/City' values with near-duplicate
+    spellings and a share (duplicate_rate) of repeated order numbers.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    regions = list(PLACES)
+    order_numbers = []
+    for serial in range(1, rows + 1):
+        if order_numbers and rng.random() < duplicate_rate:
+            order_number = rng.choice(order_numbers)
+        else:
+            order_number = f"PO-{seed:03d}-{serial:09d}"
+            order_numbers.append(order_number)
+        region = rng.choice(regions)
+        city = rng.choice(PLACES[region])
+        name, name_cn = rng.choice(PRODUCTS)
+        weight = rng.uniform(0.05, 25)
+        created = start + datetime.timedelta(seconds=rng.randrange(60 * 60 * 24 * 60))
+        phone = rng.randrange(900000000, 999999999)
+        yield (
+            serial,
+            rng.choice(STATUSES),
+            created.strftime('%Y-%m-%d %H:%M:%S'),
+            order_number,
+            f"{weight:.2f}".replace('.', ',') if rng.random() < 0.9 else round(weight, 2),
+            name,
+            name_cn,
+            f"{rng.randrange(1, 120)}-uy, {rng.randrange(1, 80)}-xonadon",
+            f"{misspell(rng, region)}/{misspell(rng, city)}",
+            f"O'zbekiston/{rng.choice([region, region.upper(), region.lower()])}",
+            phone if rng.random() < 0.7 else f"+998{phone}",
+        )
+
+
+def generate_manifest(rows, fmt='xlsx', seed=0, duplicate_rate=0.1):
+    """
+    Builds a synthetic manifest of the given size and format ('xlsx' or 'csv').
+    Returns a binary file object positioned at the start.
+    """
+    data = generate_manifest_rows(rows, seed=seed, duplicate_rate=duplicate_rate)
+    output = io.BytesIO()
+    if fmt == 'xlsx':
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(MANIFEST_HEADER)
+        for row in data:
+            ws.append(row)
+        wb.save(output)
+    elif fmt == 'csv':
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(MANIFEST_HEADER)
+        writer.writerows(data)
+        text.detach()
+    else:
+        raise ValueError(f"Unsupported manifest format: {fmt}")
+    output.seek(0)
+    return output
+
+
+@contextlib.contextmanager
+def timed_fuzzy_matching():
+    """
+    Accumulates the wall time spent in CityMatcher.match_many into the yielded dict.
+    """
+    timings = {'seconds': 0.0}
+    original = CityMatcher.match_many
+
+    def match_many(self, pairs):
+        started = time.perf_counter()
+        try:
+            return original(self, pairs)
+        finally:
+            timings['seconds'] += time.perf_counter() - started
+
+    CityMatcher.match_many = match_many
+    try:
+        yield timings
+    finally:
+        CityMatcher.match_many = original
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None where it can't be measured.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure_import(manifest, rows, **import_kwargs):
+    """
+    Imports manifest into the current database and returns timing and query statistics.
+    rows is the number of data rows in the manifest.
+    """
+    queries = {'count': 0}
+
+    def count_queries(execute, sql, params, many, context):
+        queries['count'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_queries), timed_fuzzy_matching() as fuzzy:
+        started = time.perf_counter()
+        messages = import_products_from_excel(manifest, **import_kwargs)
+        elapsed = time.perf_counter() - started
+
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+        'queries': queries['count'],
+        'queries_per_row': round(queries['count'] / rows, 4) if rows else None,
+        'fuzzy_seconds': round(fuzzy['seconds'], 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'summary': messages[-1],
+    }
+
+
+def seed_product_table(rows, cities=30, couriers=50, seed=0, batch_size=5000, unassigned=0.2, statuses=None):
+    """
+    Creates a region with the given number of cities and couriers and bulk-creates rows products
+    spread over them (the unassigned fraction left without a courier), over a year of dates and
+    all statuses (or the given ones), to give the query planner a realistically sized table.
+    Returns (region, cities, couriers).
+    """
+    rng = random.Random(seed)
+    region = Region.objects.create(name=f"Benchmark region {seed}")
+    cities = City.objects.bulk_create([
+        City(name=f"Benchmark city {seed}-{number}", region=region) for number in range(cities)
+    ])
+    users = User.objects.bulk_create([
+        User(username=f"benchmark-{seed}-{number}", full_name=f"Courier {number}", role='Courier')
+        for number in range(couriers)
+    ])
+    couriers = Courier.objects.bulk_create([Courier(user=user) for user in users])
+
+    statuses = statuses or ['Pending', 'Dispatched', 'Received', 'Delivered', 'Delivered', 'Delivered', 'Cancelled']
+    start = datetime.date(2025, 1, 1)
+    products = (
+        Product(
+            order_number=f"SEED-{seed:03d}-{serial:09d}",
+            date=start + datetime.timedelta(days=rng.randrange(365)),
+            weight=round(rng.uniform(0.05, 25), 2),
+            address="Street",
+            phone_number="+998901234567",
+            region=region,
+            city=rng.choice(cities),
+            order_status=rng.choice(statuses),
+            assigned_to=rng.choice(couriers) if rng.random() >= unassigned else None,
+        )
+        for serial in range(rows)
+    )
+    while batch := list(itertools.islice(products, batch_size)):
+        Product.objects.bulk_create(batch)
+    return region, cities, couriers
+
+
+def hot_product_queries(courier, region, city, order_numbers):
+    """
+    The Product queries that run on every request or import chunk: the product and courier
+    lists (first and a deep keyset page), the admin changelist and API filters and the import
+    dedupe lookup.
+    """
+    newest = ('-date', '-id')
+    middle = Product.objects.order_by(*newest).values_list(*[name.lstrip('-') for name in newest])[
+        Product.objects.count() // 2]
+    deep_page = KeysetPagination.after(newest, middle)
+    return {
+        'product_list': Product.objects.order_by(*newest)[:100],
+        'product_list_deep_page': Product.objects.filter(deep_page).order_by(*newest)[:100],
+        'courier_list': Product.objects.filter(assigned_to=courier).order_by(*newest)[:100],
+        'courier_list_deep_page': Product.objects.filter(deep_page, assigned_to=courier).order_by(*newest)[:100],
+        'courier_open_products': Product.objects.filter(assigned_to=courier, order_status='Dispatched'),
+        'admin_status_filter': Product.objects.filter(order_status='Pending').order_by(*newest)[:20],
+        'admin_region_filter': Product.objects.filter(region=region).order_by('-pk')[:20],
+        'admin_city_filter': Product.objects.filter(city=city).order_by('-pk')[:20],
+        'admin_unassigned_filter': Product.objects.filter(assigned_to__isnull=True).order_by('-pk')[:20],
+        'import_dedupe': Product.objects.filter(order_number__in=order_numbers).values_list('order_number'),
+        'api_order_number_prefix': Product.objects.filter(**{
+            f'order_number__{lookup}': value for lookup, value in prefix_range('SEED-000-0000001').items()
+        }).order_by('-date', '-id')[:100],
+    }
+
+
+def query_plans(querysets):
+    """
+    Returns the database's query plan (EXPLAIN QUERY PLAN on SQLite) for each named queryset.
+    """
+    return {name: queryset.explain() for name, queryset in querysets.items()}
+
+
+def time_queries(querysets, repeat=20):
+    """
+    Returns the average wall time in milliseconds of evaluating each named queryset.
+    """
+    timings = {}
+    for name, queryset in querysets.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset.all())
+        timings[name] = round((time.perf_counter() - started) / repeat * 1000, 3)
+    return timings
+
+
+def serialize_product_list(queryset, fast=True):
+    """
+    Renders queryset as the product list endpoints do: through the fast path
+    (product_list_values + orjson) or through ProductSerializer and DRF's JSONRenderer.
+    """
+    if fast:
+        data = product_list_rows(list(product_list_values(queryset)))
+        return ORJSONRenderer().render(data)
+    data = ProductSerializer(queryset.select_related('region', 'city'), many=True).data
+    return JSONRenderer().render(data)
+
+
+def compare_product_list_serialization(queryset, repeat=5):
+    """
+    Times both product list paths over queryset (best of repeat runs) and checks that
+    they render identical bytes.
+    """
+    results = {}
+    for path, fast in (('serializer', False), ('fast_path', True)):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = serialize_product_list(queryset, fast=fast)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[path] = (round(best * 1000, 2), content)
+
+    (serializer_ms, expected), (fast_ms, content) = results['serializer'], results['fast_path']
+    return {
+        'rows': queryset.count(),
+        'serializer_ms': serializer_ms,
+        'fast_path_ms': fast_ms,
+        'speedup': round(serializer_ms / fast_ms, 1) if fast_ms else None,
+        'identical': content == expected,
+        'bytes': len(content),
+    }
+
+
+def benchmark_auto_assignment(rows=100000, couriers=500, cities=100, coverage=3, seed=0):
+    """
+    Seeds rows open products (nine in ten unassigned, the rest existing workload), couriers
+    covering coverage random cities each (and every city covered), then times the snapshot,
+    planning and write-back phases of the automatic assignment and reports how evenly the
+    open parcels ended up spread over the couriers.
+    """
+    rng = random.Random(seed)
+    _, cities, couriers = seed_product_table(
+        rows, cities=cities, couriers=couriers, seed=seed, unassigned=0.9,
+        statuses=['Pending', 'Pending', 'Dispatched', 'Received'])
+    Courier.covered_cities.through.objects.bulk_create([
+        Courier.covered_cities.through(courier_id=courier.pk, city_id=city.pk)
+        for number, courier in enumerate(couriers)
+        for city in {cities[number % len(cities)], *rng.sample(cities, coverage - 1)}
+    ])
+
+    stats = {}
+    started = time.perf_counter()
+    candidates, coverage_map, loads = load_assignment_snapshot(Product.objects.all())
+    stats['snapshot_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    started = time.perf_counter()
+    plan, uncovered = plan_assignment(candidates, coverage_map, loads)
+    stats['plan_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    started = time.perf_counter()
+    stats['assigned'] = write_assignment(plan)
+    stats['write_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    stats['uncovered'] = len(uncovered)
+
+    parcels = sorted(Product.objects.exclude(assigned_to=None).order_by().values('assigned_to').annotate(
+        parcels=Count('id')).values_list('parcels', flat=True))
+    stats['parcels_per_courier'] = f"min {parcels[0]}, median {parcels[len(parcels) // 2]}, max {parcels[-1]}"
+    return stats
+
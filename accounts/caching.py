@@ -0,0 +1,98 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import current_revisions
+from django.utils.http import parse_etags, quote_etag
+
+# Bumped whenever a Region or City changes; cached reference lists are keyed by it,
+# so a list built from data that changed meanwhile is never served again.
+REFERENCE_GENERATION_KEY = 'reference:generation'
+
+
+def reference_cache():
+    """
+    The cache backend for reference data, selected by the REFERENCE_CACHE_ALIAS setting.
+    """
+    return caches[getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')]
+
+
+def reference_cache_timeout():
+    """
+    Lifetime of cached reference data and of the generation, so that a process whose cache
+    missed an invalidation (a per-process backend) still catches up eventually.
+    """
+    return getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 300)
+
+
+def reference_generation():
+    cache = reference_cache()
+    generation = cache.get(REFERENCE_GENERATION_KEY)
+    if generation is None:
+        cache.add(REFERENCE_GENERATION_KEY, uuid.uuid4().hex, reference_cache_timeout())
+        generation = cache.get(REFERENCE_GENERATION_KEY)
+    return generation
+
+
+def invalidate_reference_cache():
+    """
+    Drops every cached reference list once the current transaction commits.
+    """
+    transaction.on_commit(
+        lambda: reference_cache().set(REFERENCE_GENERATION_KEY, uuid.uuid4().hex, reference_cache_timeout()))
+
+
+def get_cached_reference(name, build):
+    """
+    Returns (etag, data) for the reference list called name, calling build() to produce
+    the data on a cache miss.
+    """
+    cache = reference_cache()
+    key = f'reference:{name}:{reference_generation()}'
+    cached = cache.get(key)
+    if cached is None:
+        data = build()
+        cached = (compute_etag(data), data)
+        cache.set(key, cached, reference_cache_timeout())
+    return cached
+
+
+def compute_etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+    return quote_etag(hashlib.md5(payload, usedforsecurity=False).hexdigest())
+
+
+def etag_matches(request, etag):
+    """
+    True when the request's If-None-Match header already names etag.
+    """
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or etag in etags
+
+
+def product_list_etag(*vary_on):
+    """
+    ETag for a product list (the list itself varies on vary_on, e.g. the request path) that
+    costs no scan of the table: the product revision counter, which every product write and
+    delete advances, and the reference counter, which changes with the region and city
+    names the list joins in, read together in one query. Both live in the database, so every
+    process gives a list the same ETag; any change anywhere gives every list a new one.
+    """
+    revisions = current_revisions('product', 'reference')
+    return compute_etag([revisions['product'], revisions['reference'], *vary_on])
+
+
+def product_set_etag(queryset, *vary_on):
+    """
+    ETag for exactly the products of queryset, from one aggregate over it: its highest
+    revision (an added or changed product raises it) and its row count (a product leaving
+    the set lowers it). Only for small sets, such as one courier's open products.
+    """
+    stats = queryset.order_by().aggregate(revision=Max('revision'), count=Count('pk'))
+    return compute_etag([stats['revision'], stats['count'], *vary_on])
@@ -0,0 +1,97 @@
+import csv
+import io
+import tempfile
+
+import openpyxl
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+# Rows fetched from the database per round trip while exporting.
+EXPORT_CHUNK_SIZE = 2000
+
+# (column header, Product lookup) of every exported column.
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('order_number', 'order_number'),
+    ('date', 'date'),
+    ('order_status', 'order_status'),
+    ('name', 'name'),
+    ('weight', 'weight'),
+    ('address', 'address'),
+    ('region', 'region__name'),
+    ('city', 'city__name'),
+    ('phone_number', 'phone_number'),
+    ('courier', 'assigned_to__user__full_name'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+]
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+def iter_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields one tuple per product of queryset, in EXPORT_COLUMNS order, reading the table
+    chunk_size rows at a time instead of loading it into memory.
+    """
+    return queryset.values_list(*[lookup for _, lookup in EXPORT_COLUMNS]).iterator(chunk_size=chunk_size)
+
+
+def stream_csv(rows, batch_size=500):
+    """
+    Yields the CSV encoding of rows (with a header and a UTF-8 BOM, so Excel detects the
+    encoding): the header right away, before the first query runs, then batch_size rows
+    at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    buffer.write('\ufeff')
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    yield flush()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield flush()
+    if buffer.tell():
+        yield flush()
+
+
+def write_xlsx(rows, output):
+    """
+    Writes rows as an XLSX workbook to the binary file output. openpyxl's write_only mode
+    keeps memory use flat however many rows there are.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Products")
+    ws.append([header for header, _ in EXPORT_COLUMNS])
+    for row in rows:
+        ws.append(row)
+    wb.save(output)
+
+
+def export_products_response(queryset, file_format):
+    """
+    Returns an attachment response with the products of queryset as CSV or XLSX.
+
+    CSV is streamed while it is read from the database. XLSX is a zip archive that can only
+    be finished after the last row, so it is built in a temporary file and then streamed.
+    """
+    filename = f"products-{timezone.localdate():%Y%m%d}.{file_format}"
+    rows = iter_export_rows(queryset)
+    if file_format == 'csv':
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    if file_format == 'xlsx':
+        output = tempfile.TemporaryFile()
+        write_xlsx(rows, output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=filename)
+    raise ValueError(f"Unsupported export format: {file_format}")
@@ -1,4 +1,9 @@
+import sys
+
 from django.contrib.admin import SimpleListFilter
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
 
 
 class AssignedFilter(SimpleListFilter):
@@ -17,3 +22,90 @@ class AssignedFilter(SimpleListFilter):
         if self.value() == 'unassigned':
             return queryset.filter(assigned_to__isnull=True)
         return queryset
+
+
+def prefix_range(prefix):
+    """
+    Lookups matching strings that start with prefix as a range (prefix <= value < next prefix),
+    which any B-tree index can serve, unlike LIKE 'prefix%' against a case-sensitive index.
+    """
+    if ord(prefix[-1]) == sys.maxunicode:
+        return {'startswith': prefix}
+    return {'gte': prefix, 'lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+class ProductFilterParamsSerializer(serializers.Serializer):
+    status = serializers.CharField(required=False, help_text="Order status, or several separated by commas.")
+    region = serializers.IntegerField(required=False)
+    city = serializers.IntegerField(required=False)
+    courier = serializers.IntegerField(required=False)
+    assigned = serializers.ChoiceField(choices=['assigned', 'unassigned'], required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    order_number = serializers.CharField(required=False, help_text="Order number prefix.")
+
+
+def product_filter_lookups(params):
+    """
+    Turns the validated data of ProductFilterParamsSerializer into Product filter() lookups:
+    status, region, city, courier, assigned/unassigned (as AssignedFilter in the admin), an
+    inclusive date range (date_from, date_to) and an order_number prefix.
+    """
+    lookups = {}
+    if params.get('status'):
+        lookups['order_status__in'] = [status.strip() for status in params['status'].split(',')]
+    for name, field in (('region', 'region_id'), ('city', 'city_id'), ('courier', 'assigned_to_id')):
+        if name in params:
+            lookups[field] = params[name]
+    if 'assigned' in params:
+        lookups['assigned_to__isnull'] = params['assigned'] == 'unassigned'
+    if 'date_from' in params:
+        lookups['date__gte'] = params['date_from']
+    if 'date_to' in params:
+        lookups['date__lte'] = params['date_to']
+    if params.get('order_number'):
+        lookups.update({
+            f'order_number__{lookup}': value for lookup, value in prefix_range(params['order_number']).items()
+        })
+    return lookups
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Filters products by the query parameters of ProductFilterParamsSerializer (see
+    product_filter_lookups).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = ProductFilterParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return queryset.filter(**product_filter_lookups(params.validated_data))
+
+
+class ProductOrderingFilter(BaseFilterBackend):
+    """
+    Orders products by ?ordering=field[,field...] (prefix a field with '-' for descending),
+    limited to ordering_fields. id is appended as a tiebreaker so that keyset pagination
+    (which takes its ordering from get_ordering) sees a total order.
+    """
+    ordering_param = 'ordering'
+    # Non-null columns only: keyset pagination can't seek past NULLs.
+    ordering_fields = ['date', 'order_number', 'weight', 'order_status', 'id']
+
+    def get_ordering(self, request):
+        value = request.query_params.get(self.ordering_param)
+        if not value:
+            return None
+        ordering = [name.strip() for name in value.split(',') if name.strip()]
+        invalid = [name for name in ordering if name.lstrip('-') not in self.ordering_fields]
+        if invalid or not ordering:
+            raise ValidationError({self.ordering_param: [
+                f"Invalid ordering: {', '.join(invalid) or value}. Allowed: {', '.join(self.ordering_fields)}."
+            ]})
+        if not any(name.lstrip('-') == 'id' for name in ordering):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return ordering
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request)
+        return queryset.order_by(*ordering) if ordering else queryset
@@ -5,6 +5,7 @@ from django.utils.crypto import get_random_string
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from dal import autocomplete
+from . import order_status
 from .models import Courier, City, Product
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
@@ -13,7 +14,29 @@ User = get_user_model()
 
 
 class ExcelImportForm(forms.Form):
-    excel_file = forms.FileField(label="Select Excel file")
+    excel_file = forms.FileField(
+        label="Select manifest file (Excel, CSV, NDJSON or Parquet)",
+        widget=forms.ClearableFileInput(attrs={'accept': '.xlsx,.csv,.ndjson,.jsonl,.parquet'}),
+    )
+    update_existing = forms.BooleanField(
+        label="Update existing products from the file",
+        required=False,
+    )
+
+
+class CourierSelect2(autocomplete.ModelSelect2):
+    """
+    ModelSelect2 that renders an already loaded selected courier (see ProductForm) without
+    querying for it, so changelist rows don't cost a query each.
+    """
+    selected_courier = None
+
+    def filter_choices_to_render(self, selected_choices):
+        courier = self.selected_courier
+        if courier is not None and [c for c in selected_choices if c] == [str(courier.pk)]:
+            self.choices = [(courier.pk, str(courier))]
+            return
+        super().filter_choices_to_render(selected_choices)
 
 
 class ProductForm(forms.ModelForm):
@@ -21,7 +44,7 @@ class ProductForm(forms.ModelForm):
         model = Product
         fields = '__all__'
         widgets = {
-            'assigned_to': autocomplete.ModelSelect2(
+            'assigned_to': CourierSelect2(
                 url='courier-autocomplete',
                 forward=['city'],  # Simply pass a list of field names
             )
@@ -29,12 +52,25 @@ class ProductForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # When editing an existing product with a city, filter assigned_to.
-        if self.instance and self.instance.pk and self.instance.city:
-            if 'assigned_to' in self.fields:
-                self.fields['assigned_to'].queryset = Courier.objects.filter(
-                    covered_cities=self.instance.city
-                )
+        if 'assigned_to' in self.fields:
+            field = self.fields['assigned_to']
+            field.queryset = field.queryset.select_related('user')
+            # When editing an existing product with a city, filter assigned_to.
+            if self.instance and self.instance.pk and self.instance.city_id:
+                field.queryset = Courier.objects.filter(
+                    covered_cities=self.instance.city_id
+                ).select_related('user')
+            if self.instance and self.instance.assigned_to_id:
+                # The admin wraps the widget in RelatedFieldWidgetWrapper on the change form.
+                widget = getattr(field.widget, 'widget', field.widget)
+                widget.selected_courier = self.instance.assigned_to
+
+    def clean_order_status(self):
+        status = self.cleaned_data['order_status']
+        current = self.initial.get('order_status')
+        if self.instance.pk and current and status != current and not order_status.can_transition(current, status):
+            raise ValidationError(str(order_status.InvalidTransition(current, status)))
+        return status
 
 
 def generate_valid_password(length=12, max_attempts=100):
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ImportJob
+from .utils import import_products_from_excel
+
+# Imports run on a small pool of worker threads so uploads return immediately.
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 2),
+    thread_name_prefix='import-job',
+)
+
+
+def run_import_job(job_id):
+    """
+    Runs the import for an ImportJob, recording progress on the job as chunks are written.
+    The uploaded file is deleted once the import completes; a failed job keeps it, so
+    the import can be run again.
+    """
+    jobs = ImportJob.objects.filter(pk=job_id)
+    try:
+        job = jobs.get()
+        jobs.update(status='Running', started_at=timezone.now())
+
+        def progress(rows_processed, rows_imported):
+            jobs.update(rows_processed=rows_processed, rows_imported=rows_imported)
+
+        with job.file.open('rb') as excel_file:
+            messages = import_products_from_excel(
+                excel_file,
+                progress=progress,
+                vectorized=getattr(settings, 'IMPORT_VECTORIZED', False),
+                upsert=job.upsert,
+            )
+        jobs.update(status='Completed', messages=messages, finished_at=timezone.now(), file='')
+    except Exception as e:
+        jobs.update(status='Failed', error=f"Error processing Excel file: {e}", finished_at=timezone.now())
+    else:
+        job.file.delete(save=False)
+
+
+def _run_import_job_in_worker(job_id):
+    try:
+        run_import_job(job_id)
+    finally:
+        # Worker threads get their own connection; don't leave it open between jobs.
+        connection.close()
+
+
+def submit_import_job(job):
+    """
+    Queues job on the import executor once the current transaction has committed.
+
+    The executor lives in the web process: jobs still Pending or Running when it stops
+    (e.g. on a restart) stay in that state until the recover_import_jobs command runs them
+    again or marks them Failed.
+    """
+    transaction.on_commit(lambda: _executor.submit(_run_import_job_in_worker, job.pk))
+    return job
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from accounts.assignment import auto_assign_products
+from accounts.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Assigns the unassigned open products to couriers covering their city, balancing the "
+        "couriers' open workload and weight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--region', type=int, help="Only products of this region.")
+        parser.add_argument('--city', type=int, help="Only products of this city.")
+        parser.add_argument('--dry-run', action='store_true', help="Report the assignment without saving it.")
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['region']:
+            products = products.filter(region_id=options['region'])
+        if options['city']:
+            products = products.filter(city_id=options['city'])
+        result = auto_assign_products(products, dry_run=options['dry_run'])
+        verb = "Would assign" if options['dry_run'] else "Assigned"
+        self.stdout.write(
+            f"{verb} {result['assigned']} product(s) to {result['couriers']} courier(s); "
+            f"{result['uncovered']} product(s) have no courier covering their city.")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.benchmarks import benchmark_auto_assignment
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a fresh test database with unassigned products and couriers and times the "
+        "automatic load-balanced assignment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Number of products.")
+        parser.add_argument('--couriers', type=int, default=500)
+        parser.add_argument('--cities', type=int, default=100)
+        parser.add_argument('--coverage', type=int, default=3, help="Cities covered by each courier.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding {options['rows']} products and {options['couriers']} couriers...")
+            stats = benchmark_auto_assignment(
+                options['rows'], couriers=options['couriers'], cities=options['cities'],
+                coverage=options['coverage'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for key, value in stats.items():
+            self.stdout.write(f"{key:>19}: {value}")
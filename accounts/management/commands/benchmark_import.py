@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.benchmarks import generate_manifest, measure_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic manifest and imports it into a fresh test database, "
+        "reporting rows/sec, queries per row, peak RSS and time spent in fuzzy matching."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Number of manifest rows.")
+        parser.add_argument('--format', choices=['xlsx', 'csv'], default='xlsx', dest='fmt')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--duplicate-rate', type=float, default=0.1,
+                            help="Share of rows that repeat an earlier order number.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--vectorized', action='store_true', help="Normalize rows with pandas.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Generating {options['rows']} row {options['fmt']} manifest...")
+        manifest = generate_manifest(
+            options['rows'], fmt=options['fmt'], seed=options['seed'], duplicate_rate=options['duplicate_rate'])
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            stats = measure_import(
+                manifest,
+                options['rows'],
+                chunk_size=options['chunk_size'],
+                vectorized=options['vectorized'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for key, value in stats.items():
+            self.stdout.write(f"{key:>16}: {value}")
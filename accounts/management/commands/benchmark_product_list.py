@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.benchmarks import compare_product_list_serialization, seed_product_table
+from accounts.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a fresh test database and compares serializing a product list through "
+        "ProductSerializer + JSONRenderer with the .values() + orjson fast path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Number of products in the list.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path; the best one is reported.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_product_table(options['rows'])
+            stats = compare_product_list_serialization(
+                Product.objects.order_by('-date', '-id'), repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for key, value in stats.items():
+            self.stdout.write(f"{key:>14}: {value}")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.benchmarks import hot_product_queries, query_plans, seed_product_table, time_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a fresh test database with a large Product table and reports the query plan "
+        "and average time of the hot product queries (lists, admin filters, import dedupe)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Number of products.")
+        parser.add_argument('--cities', type=int, default=30)
+        parser.add_argument('--couriers', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20, help="Executions averaged per query.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding {options['rows']} products...")
+            region, cities, couriers = seed_product_table(
+                options['rows'], cities=options['cities'], couriers=options['couriers'])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+            order_numbers = [f"SEED-000-{serial:09d}" for serial in range(0, options['rows'], 97)][:1000]
+            querysets = hot_product_queries(couriers[0], region, cities[0], order_numbers)
+            plans = query_plans(querysets)
+            timings = time_queries(querysets, repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for name, plan in plans.items():
+            self.stdout.write(f"{name} ({timings[name]} ms)")
+            for line in plan.splitlines():
+                self.stdout.write(f"    {line}")
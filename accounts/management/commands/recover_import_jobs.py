@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.jobs import run_import_job
+from accounts.models import ImportJob, ImportJournal
+
+
+class Command(BaseCommand):
+    help = (
+        "Handles product imports left Pending or Running by a stopped server: runs them again in "
+        "the foreground (an interrupted import resumes from its last committed chunk), or marks "
+        "them Failed with --mark-failed. Run it after a restart, before the web workers accept "
+        "uploads. Releases the import journals claimed by the stopped imports first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mark-failed', action='store_true', help="Mark the jobs Failed instead of running them.")
+
+    def handle(self, *args, **options):
+        # Nothing is importing before the workers start, so every claim belongs to a dead import.
+        ImportJournal.objects.exclude(claimed_by=None).update(claimed_by=None)
+        jobs = ImportJob.objects.filter(status__in=['Pending', 'Running']).order_by('pk')
+        if options['mark_failed']:
+            count = jobs.update(
+                status='Failed', error="Interrupted by a server restart.", finished_at=timezone.now())
+            self.stdout.write(f"Marked {count} interrupted import(s) as failed.")
+            return
+        for job_id in jobs.values_list('pk', flat=True):
+            run_import_job(job_id)
+            job = ImportJob.objects.get(pk=job_id)
+            self.stdout.write(f"{job}: {job.rows_imported} row(s) imported.")
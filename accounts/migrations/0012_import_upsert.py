@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_importjournal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='upsert',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='importjournal',
+            name='upsert',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='importjournal',
+            name='file_hash',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='importjournal',
+            unique_together={('file_hash', 'upsert')},
+        ),
+    ]
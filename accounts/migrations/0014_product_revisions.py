@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_product_counter(apps, schema_editor):
+    RevisionCounter = apps.get_model('accounts', 'RevisionCounter')
+    RevisionCounter.objects.using(schema_editor.connection.alias).get_or_create(name='product')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_product_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierProductRemoval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('revision', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Kuryerdan olingan pochta',
+                'verbose_name_plural': 'Kuryerdan olingan pochtalar',
+            },
+        ),
+        migrations.CreateModel(
+            name='RevisionCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='revision',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['assigned_to', 'revision'], name='product_courier_revision_idx'),
+        ),
+        migrations.AddField(
+            model_name='courierproductremoval',
+            name='courier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_removals', to='accounts.courier'),
+        ),
+        migrations.AddIndex(
+            model_name='courierproductremoval',
+            index=models.Index(fields=['courier', 'revision'], name='removal_courier_revision_idx'),
+        ),
+        migrations.RunPython(create_product_counter, migrations.RunPython.noop),
+    ]
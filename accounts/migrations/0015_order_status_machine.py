@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:29
+
+from django.db import migrations, models
+
+
+def normalize_pending(apps, schema_editor):
+    # Imported products got the old lowercase default.
+    Product = apps.get_model('accounts', 'Product')
+    Product.objects.using(schema_editor.connection.alias).filter(order_status='pending').update(
+        order_status='Pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_product_revisions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='order_status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Dispatched', 'Dispatched'), ('Received', 'Received'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], default='Pending', max_length=50),
+        ),
+        migrations.RunPython(normalize_pending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_order_status_machine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjournal',
+            name='claimed_by',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
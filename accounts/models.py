@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
 from datetime import date
 
+from .order_status import PENDING, STATUS_CHOICES
+
 
 class Region(models.Model):
     name = models.CharField(max_length=100)
@@ -83,6 +86,103 @@ class Courier(models.Model):
         verbose_name_plural = "Kuryerlar"  # Plural
 
 
+class RevisionCounter(models.Model):
+    """
+    Named monotonic counters. The product counter numbers every change to a Product
+    (see next_product_revision); the reference counter advances with every Region or City
+    change (see accounts.signals).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+def advance_revision(name, using=None):
+    """
+    Advances the counter called name. The counter row stays locked until the calling
+    transaction commits.
+    """
+    counters = RevisionCounter.objects.using(using or router.db_for_write(RevisionCounter))
+    if not counters.filter(name=name).update(value=models.F('value') + 1):
+        counters.get_or_create(name=name)
+        counters.filter(name=name).update(value=models.F('value') + 1)
+
+
+def next_revision(name, using=None):
+    """
+    Advances the counter called name (see advance_revision) and returns its new value.
+    """
+    using = using or router.db_for_write(RevisionCounter)
+    advance_revision(name, using)
+    return RevisionCounter.objects.using(using).get(name=name).value
+
+
+def current_revisions(*names, using=None):
+    """
+    The committed values of the named counters, as {name: value}, in one query.
+    """
+    counters = RevisionCounter.objects.using(using or router.db_for_read(RevisionCounter))
+    values = dict(counters.filter(name__in=names).values_list('name', 'value'))
+    return {name: values.get(name, 0) for name in names}
+
+
+def next_product_revision(using=None):
+    """
+    Allocates the next product revision. Must be called inside the transaction that writes
+    the products: the counter row stays locked until it commits, so revisions become
+    visible in increasing order and a reader that has seen revision N has seen every
+    change up to N.
+    """
+    return next_revision('product', using)
+
+
+def current_product_revision(using=None):
+    """
+    The highest committed product revision.
+    """
+    return current_revisions('product', using=using)['product']
+
+
+class ProductQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            revision = next_product_revision(self.db)
+            for obj in objs:
+                obj.revision = revision
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        """
+        Stamps the updated rows with a new revision and logs the products that leave a
+        courier, so courier delta sync sees the change. bulk_update() goes through here too.
+        A caller that needs to know the revision can allocate it with next_product_revision()
+        in its own transaction and pass it as revision=.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            if 'revision' not in kwargs:
+                kwargs['revision'] = next_product_revision(self.db)
+            kwargs['updated_at'] = timezone.now()
+            if 'assigned_to' not in kwargs and 'assigned_to_id' not in kwargs:
+                return super().update(**kwargs)
+
+            before = dict(self.exclude(assigned_to=None).values_list('id', 'assigned_to_id'))
+            updated = super().update(**kwargs)
+            removals = []
+            ids = list(before)
+            for start in range(0, len(ids), 10000):
+                after = self.model._base_manager.using(self.db).filter(pk__in=ids[start:start + 10000])
+                removals.extend(
+                    CourierProductRemoval(product_id=pk, courier_id=before[pk], revision=kwargs['revision'])
+                    for pk, courier_id in after.values_list('id', 'assigned_to_id')
+                    if courier_id != before[pk]
+                )
+            CourierProductRemoval.objects.using(self.db).bulk_create(removals)
+            return updated
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100, null=True, blank=True)
     date = models.DateField(default=date.today)
@@ -92,22 +192,70 @@ class Product(models.Model):
     region = models.ForeignKey('Region', on_delete=models.SET_NULL, null=True)
     city = models.ForeignKey('City', on_delete=models.SET_NULL, null=True)
     phone_number = models.CharField(max_length=15)
-    order_status = models.CharField(max_length=50, choices=[
-        ('Pending', 'Pending'),
-        ('Dispatched', 'Dispatched'),
-        ('Delivered', 'Delivered'),
-        ('Cancelled', 'Cancelled')
-    ], default="pending")
+    # Change it through accounts.order_status, not by assignment and save().
+    order_status = models.CharField(max_length=50, choices=STATUS_CHOICES, default=PENDING)
     assigned_to = models.ForeignKey('Courier', related_name='products', on_delete=models.SET_NULL, null=True, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Set from next_product_revision() on every write; see ProductQuerySet and save().
+    revision = models.PositiveBigIntegerField(default=0, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} - {self.order_number}"
 
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Product, instance=self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'revision', 'updated_at'}
+        with transaction.atomic(using=using, savepoint=False):
+            previous_courier_id = None
+            if not self._state.adding and self.pk is not None:
+                previous_courier_id = Product._base_manager.using(using).filter(pk=self.pk).values_list(
+                    'assigned_to_id', flat=True).first()
+            self.revision = next_product_revision(using)
+            super().save(*args, **kwargs)
+            if previous_courier_id is not None and previous_courier_id != self.assigned_to_id:
+                CourierProductRemoval.objects.using(using).create(
+                    product_id=self.pk, courier_id=previous_courier_id, revision=self.revision)
+
     class Meta:
         verbose_name = "Pochta"  # Singular
         verbose_name_plural = "Pochtalar"  # Plural
+        indexes = [
+            # Product list, newest first (keyset pagination on date, id).
+            models.Index(fields=['date', 'id'], name='product_date_id_idx'),
+            # Courier product list, newest first.
+            models.Index(fields=['assigned_to', 'date', 'id'], name='product_courier_date_idx'),
+            # A courier's products in a given status (open workload, confirmations).
+            models.Index(fields=['assigned_to', 'order_status'], name='product_courier_status_idx'),
+            # Status filter in the admin and the API, newest first.
+            models.Index(fields=['order_status', 'date', 'id'], name='product_status_date_idx'),
+            # Courier delta sync: a courier's products changed since a revision.
+            models.Index(fields=['assigned_to', 'revision'], name='product_courier_revision_idx'),
+        ]
+
+
+class CourierProductRemoval(models.Model):
+    """
+    A product that left a courier's list (reassigned, unassigned or deleted) at a revision,
+    so the courier's delta sync can tell the app to drop it.
+    """
+    courier = models.ForeignKey(Courier, on_delete=models.CASCADE, related_name='product_removals')
+    product_id = models.BigIntegerField()
+    revision = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return f"{self.courier} - {self.product_id} @ {self.revision}"
+
+    class Meta:
+        verbose_name = "Kuryerdan olingan pochta"
+        verbose_name_plural = "Kuryerdan olingan pochtalar"
+        indexes = [
+            models.Index(fields=['courier', 'revision'], name='removal_courier_revision_idx'),
+        ]
 
 
 class ProductImage(models.Model):
@@ -120,4 +268,81 @@ class ProductImage(models.Model):
 
     class Meta:
         verbose_name = "Pochta rasmi"
-        verbose_name_plural = "Pochta rasmlari"
\ No newline at end of file
+        verbose_name_plural = "Pochta rasmlari"
+
+class ImportJobQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        The jobs user may see: the ones they started, or every job for admins.
+        """
+        if user.is_superuser or user.role == 'Admin':
+            return self
+        return self.filter(created_by=user)
+
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Running', 'Running'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+    file = models.FileField(upload_to="imports/")
+    upsert = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_imported = models.PositiveIntegerField(default=0)
+    messages = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ImportJobQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.status})"
+
+    @property
+    def throughput(self):
+        """
+        Rows processed per second since the job started.
+        """
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    class Meta:
+        verbose_name = "Import"
+        verbose_name_plural = "Importlar"
+
+
+class ImportJournal(models.Model):
+    """
+    Checkpoint of an import, keyed by the SHA-256 of the uploaded file and the import mode
+    (plain insert or upsert). rows_committed is
+    advanced in the same transaction as each written chunk, so a re-submitted file can skip
+    exactly the rows that are already in the database. Only one import at a time may work on
+    a journal: the one whose token is in claimed_by.
+    """
+    file_hash = models.CharField(max_length=64)
+    upsert = models.BooleanField(default=False)
+    rows_committed = models.PositiveIntegerField(default=0)
+    rows_imported = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    # Token of the import currently working on the file (see accounts.utils.claim_import_journal).
+    claimed_by = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.file_hash
+
+    class Meta:
+        verbose_name = "Import jurnali"
+        verbose_name_plural = "Import jurnallari"
+        unique_together = [('file_hash', 'upsert')]
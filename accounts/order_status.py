@@ -0,0 +1,81 @@
+"""
+The Product.order_status state machine:
+
+    Pending -> Dispatched -> Received -> Delivered
+       |          |             |
+       +----------+-------------+-> Cancelled
+
+A product can also be received straight from Pending and delivered straight from Dispatched.
+Transitions are compare-and-set UPDATEs that only write the status (and the revision
+bookkeeping), so concurrent writers can't overwrite each other's changes.
+"""
+
+PENDING = 'Pending'
+DISPATCHED = 'Dispatched'
+RECEIVED = 'Received'
+DELIVERED = 'Delivered'
+CANCELLED = 'Cancelled'
+
+STATUS_CHOICES = [
+    (PENDING, 'Pending'),
+    (DISPATCHED, 'Dispatched'),
+    (RECEIVED, 'Received'),
+    (DELIVERED, 'Delivered'),
+    (CANCELLED, 'Cancelled'),
+]
+
+TRANSITIONS = {
+    PENDING: {DISPATCHED, RECEIVED, CANCELLED},
+    DISPATCHED: {RECEIVED, DELIVERED, CANCELLED},
+    RECEIVED: {DELIVERED, CANCELLED},
+    DELIVERED: set(),
+    CANCELLED: set(),
+}
+
+# Statuses a courier still has work to do on.
+OPEN_STATUSES = tuple(status for status, _ in STATUS_CHOICES if TRANSITIONS[status])
+
+
+class InvalidTransition(ValueError):
+    def __init__(self, current, target):
+        self.current, self.target = current, target
+        super().__init__(f"Product status cannot change from {current} to {target}.")
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def sources(target):
+    """
+    The statuses a product can move to target from.
+    """
+    return {status for status, targets in TRANSITIONS.items() if target in targets}
+
+
+def transition(queryset, target, from_statuses=None, **extra):
+    """
+    Moves every product of queryset whose status allows it (and is in from_statuses, when
+    given) to target, in one conditional UPDATE. extra is passed on to the update (e.g. a
+    revision allocated by the caller). Returns the number of products moved.
+    """
+    allowed = sources(target)
+    if from_statuses is not None:
+        allowed &= set(from_statuses)
+    return queryset.filter(order_status__in=allowed).update(order_status=target, **extra)
+
+
+def transition_product(product, target, expected=None):
+    """
+    Compare-and-set for one product: moves it to target only if its status in the database
+    is still expected (default: product.order_status as loaded). Raises InvalidTransition
+    if the state machine forbids the move; returns False if the status changed meanwhile.
+    """
+    expected = product.order_status if expected is None else expected
+    if not can_transition(expected, target):
+        raise InvalidTransition(expected, target)
+    updated = type(product)._default_manager.filter(pk=product.pk, order_status=expected).update(
+        order_status=target)
+    if updated:
+        product.order_status = target
+    return bool(updated)
@@ -0,0 +1,150 @@
+import base64
+import functools
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values):
+    """
+    Packs a list of JSON-serializable values into an opaque, URL-safe cursor.
+    """
+    data = json.dumps(values, cls=DjangoJSONEncoder).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(encoded):
+    """
+    Reverses encode_cursor. Raises ValueError for a malformed cursor.
+    """
+    values = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+    if not isinstance(values, list):
+        raise ValueError("Cursor must hold a list")
+    return values
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination: each page starts right after the last row of the previous one,
+    using a WHERE clause on the ordering columns instead of an OFFSET, so every page costs
+    the same however deep it is.
+
+    The ordering must end with a unique, non-null field (the primary key) so that rows
+    are totally ordered. Cursors are opaque base64 strings holding the ordering values of
+    the last row of a page.
+    """
+    ordering = ('-id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_ordering(self, request, queryset, view):
+        """
+        The ordering requested through an ordering filter backend of the view (one with a
+        get_ordering(request) method, as ProductOrderingFilter), else self.ordering.
+        """
+        for backend in getattr(view, 'filter_backends', ()):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request)
+                if ordering:
+                    return ordering
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request, queryset, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = decode_cursor(encoded)
+            if len(values) != len(ordering):
+                raise ValueError
+            fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def after(ordering, values):
+        """
+        Q matching the rows that come after values in ordering: lexicographic comparison
+        expressed as (a > x) OR (a = x AND b > y) OR ...
+
+        The redundant a >= x bound in front lets the database seek into an index on the
+        ordering columns rather than scan it from the start.
+        """
+        conditions = []
+        for position, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {prefix.lstrip('-'): value for prefix, value in zip(ordering[:position], values)}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': values[position]}))
+        first = ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        return bound & functools.reduce(lambda left, right: left | right, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.ordering_value = list(self.get_ordering(request, queryset, view))
+
+        queryset = queryset.order_by(*self.ordering_value)
+        cursor = self.decode_cursor(request, queryset, self.ordering_value)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(self.ordering_value, cursor))
+
+        page = list(queryset[:self.page_size_value + 1])
+        self.next_values = None
+        if len(page) > self.page_size_value:
+            page = page[:self.page_size_value]
+            # Pages may hold model instances or .values() rows.
+            last = page[-1]
+            get = last.get if isinstance(last, dict) else functools.partial(getattr, last)
+            self.next_values = [get(name.lstrip('-')) for name in self.ordering_value]
+        return page
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encode_cursor(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductKeysetPagination(KeysetPagination):
+    """
+    Newest products first, ordered by (date, id). Page size defaults to the
+    PRODUCT_PAGE_SIZE setting and can be changed per request with ?page_size=.
+    """
+    ordering = ('-date', '-id')
+    page_size = getattr(settings, 'PRODUCT_PAGE_SIZE', 100)
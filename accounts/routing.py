@@ -0,0 +1,149 @@
+"""
+Delivery route optimization for a courier's open products.
+
+Stops are ordered by nearest neighbour on a haversine distance matrix, then improved by 2-opt
+moves until none shortens the route or the time budget (ROUTE_TIME_BUDGET seconds) runs out.
+Routes are open paths: they start at the courier's position when it is given (anywhere
+otherwise) and end at whichever stop is last.
+"""
+import time
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+
+from . import order_status
+from .caching import product_set_etag
+from .models import Product
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    The great-circle distance in kilometres between points given in degrees; NumPy arrays
+    are compared element-wise (with broadcasting).
+    """
+    lat1, lng1, lat2, lng2 = (numpy.radians(numpy.asarray(value, dtype=float)) for value in (lat1, lng1, lat2, lng2))
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+
+
+def haversine_matrix(latitudes, longitudes):
+    """
+    The distance in kilometres between every pair of points, as an n x n array.
+    """
+    latitudes, longitudes = numpy.asarray(latitudes, dtype=float), numpy.asarray(longitudes, dtype=float)
+    return haversine(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
+
+
+def nearest_neighbour_route(distances, start):
+    """
+    Visits every node of the distance matrix, starting at start and always going to the
+    closest node not visited yet.
+    """
+    unvisited = numpy.ones(len(distances), dtype=bool)
+    route = [start]
+    unvisited[start] = False
+    for _ in range(len(distances) - 1):
+        nearest = int(numpy.argmin(numpy.where(unvisited, distances[route[-1]], numpy.inf)))
+        route.append(nearest)
+        unvisited[nearest] = False
+    return numpy.array(route)
+
+
+def two_opt(route, distances, deadline):
+    """
+    Shortens route by reversing segments (2-opt) until no reversal helps or time.perf_counter()
+    passes deadline. The first and last node stay in place. For each edge, the best
+    reversal starting after it is found with one vectorized pass over the later edges.
+    """
+    route = route.copy()
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(len(route) - 3):
+            a, b = route[i], route[i + 1]
+            c, d = route[i + 2:-1], route[i + 3:]
+            delta = distances[a, c] + distances[b, d] - distances[a, b] - distances[c, d]
+            best = int(numpy.argmin(delta))
+            if delta[best] < -1e-9:
+                j = i + 2 + best
+                route[i + 1:j + 1] = route[i + 1:j + 1][::-1].copy()
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return route
+
+
+def optimize_route(latitudes, longitudes, start=None, time_budget=None):
+    """
+    Returns (order, kilometres): the indexes of the given points in visiting order and the
+    length of the route, starting from start ((latitude, longitude)) when given.
+    """
+    if time_budget is None:
+        time_budget = getattr(settings, 'ROUTE_TIME_BUDGET', 0.3)
+    deadline = time.perf_counter() + time_budget
+    if not len(latitudes):
+        return [], 0.0
+
+    offset = 0 if start is None else 1
+    if start is not None:
+        latitudes, longitudes = [start[0], *latitudes], [start[1], *longitudes]
+    points = len(latitudes)
+    # An extra node at distance 0 from every point closes the path into a tour, so the route
+    # can end (and, without a start, begin) anywhere while 2-opt keeps it in place.
+    free = points
+    distances = numpy.zeros((points + 1, points + 1))
+    distances[:points, :points] = haversine_matrix(latitudes, longitudes)
+
+    # Without a start position, begin at the outermost stop.
+    first = 0 if start is not None else int(numpy.argmax(distances[:points, :points].sum(axis=1)))
+    route = numpy.append(nearest_neighbour_route(distances[:points, :points], first), free)
+    if start is None:
+        route = numpy.insert(route, 0, free)
+    route = two_opt(route, distances, deadline)
+
+    kilometres = float(distances[route[:-1], route[1:]].sum())
+    order = [int(node) - offset for node in route if node != free and node >= offset]
+    return order, kilometres
+
+
+def courier_route(courier, start=None):
+    """
+    Returns (etag, route) for the open products of courier: route has the located products
+    as "stops" in visiting order (with the length of the leg leading to each), the total
+    "distance_km" and the ids of the products without coordinates as "unrouted".
+
+    Routes are cached under the ETag of the courier's open products (see product_set_etag), so
+    any change to the courier's open products (added, removed, edited or delivered) computes
+    a new one.
+    """
+    products = Product.objects.filter(assigned_to=courier, order_status__in=order_status.OPEN_STATUSES)
+    etag = product_set_etag(products, 'route', start)
+    key = f'route:{courier.pk}:{etag}'
+    route = cache.get(key)
+    if route is None:
+        rows = list(products.order_by('id').values_list('id', 'order_number', 'address', 'latitude', 'longitude'))
+        located = [row for row in rows if row[3] is not None and row[4] is not None]
+        order, kilometres = optimize_route(
+            [float(row[3]) for row in located], [float(row[4]) for row in located], start)
+
+        latitudes = [float(located[index][3]) for index in order]
+        longitudes = [float(located[index][4]) for index in order]
+        legs = haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]).tolist()
+        legs.insert(0, float(haversine(*start, latitudes[0], longitudes[0])) if start and order else 0.0)
+        stops = [
+            {
+                'product_id': located[index][0], 'order_number': located[index][1], 'address': located[index][2],
+                'latitude': latitude, 'longitude': longitude, 'leg_km': round(leg, 3),
+            }
+            for index, latitude, longitude, leg in zip(order, latitudes, longitudes, legs)
+        ]
+        route = {
+            'stops': stops,
+            'distance_km': round(kilometres, 3),
+            'unrouted': [row[0] for row in rows if row[3] is None or row[4] is None],
+        }
+        cache.set(key, route, getattr(settings, 'ROUTE_CACHE_TIMEOUT', 24 * 60 * 60))
+    return etag, route
@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers
-from .models import Courier, Product, Region, City, ProductImage
+from . import order_status
+from .filter import ProductFilterParamsSerializer
+from .models import Courier, Product, Region, City, ProductImage, ImportJob
 from .forms import CourierCreationForm
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -127,6 +131,27 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_city_name(self, obj):
         return obj.city.name if obj.city else None
 
+    def update(self, instance, validated_data):
+        """
+        Writes only the submitted columns; a status change goes through the order status
+        state machine as a compare-and-set against the status this request loaded.
+        """
+        target = validated_data.pop('order_status', instance.order_status)
+        with transaction.atomic():
+            if validated_data:
+                for attr, value in validated_data.items():
+                    setattr(instance, attr, value)
+                instance.save(update_fields=list(validated_data))
+            if target != instance.order_status:
+                try:
+                    changed = order_status.transition_product(instance, target)
+                except order_status.InvalidTransition as e:
+                    raise serializers.ValidationError({'order_status': [str(e)]})
+                if not changed:
+                    raise serializers.ValidationError(
+                        {'order_status': ["Product status was changed meanwhile, please retry."]})
+        return instance
+
     def validate(self, data):
         """
         Check that the courier covers the city of the product.
@@ -142,7 +167,112 @@ class ProductSerializer(serializers.ModelSerializer):
         return data
 
 
+def product_list_values(queryset, fields=None):
+    """
+    Read-only fast path for product lists: a .values() queryset with ProductSerializer's
+    fields (or only the given subset of them), region_name and city_name joined in SQL
+    when asked for. Pass the fetched rows through product_list_rows() to get exactly what
+    ProductSerializer(many=True).data holds.
+    """
+    fields = ProductSerializer.Meta.fields if fields is None else fields
+    joins = {'region_name': F('region__name'), 'city_name': F('city__name')}
+    return queryset.annotate(**{name: joins[name] for name in fields if name in joins}).values(*fields)
+
+
+def product_list_rows(rows, drop=()):
+    """
+    Formats rows from product_list_values() like ProductSerializer, removing the drop keys
+    (columns fetched only for pagination).
+    """
+    for row in rows:
+        if 'weight' in row:
+            # DecimalField renders as a fixed-point string.
+            row['weight'] = format(row['weight'], 'f')
+        for name in drop:
+            del row[name]
+    return rows
+
+
+def parse_product_fields(value):
+    """
+    Parses a ?fields= sparse fieldset (comma separated ProductSerializer field names) into
+    the requested fields in serializer order. Returns None when value is empty.
+    """
+    requested = {name.strip() for name in (value or '').split(',') if name.strip()}
+    if not requested:
+        return None
+    unknown = requested.difference(ProductSerializer.Meta.fields)
+    if unknown:
+        raise serializers.ValidationError({'fields': [f"Unknown fields: {', '.join(sorted(unknown))}."]})
+    return [name for name in ProductSerializer.Meta.fields if name in requested]
+
+
+class ProductIdsSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+
+
+class BulkAssignSerializer(serializers.Serializer):
+    """
+    A courier and the products to assign to it: either explicit product_ids or a filter
+    with the parameters of the product list (e.g. {"city": 3, "assigned": "unassigned"}).
+    """
+    courier = serializers.PrimaryKeyRelatedField(queryset=Courier.objects.all())
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=10000)
+    filter = ProductFilterParamsSerializer(required=False)
+
+    def validate(self, data):
+        if ('product_ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Pass either product_ids or filter.")
+        if 'filter' in data and not data['filter']:
+            raise serializers.ValidationError({'filter': ["Set at least one filter."]})
+        return data
+
+
+class AutoAssignSerializer(serializers.Serializer):
+    """
+    Optional filter (the parameters of the product list) limiting which unassigned products
+    are assigned automatically, and dry_run to only report what would be assigned.
+    """
+    filter = ProductFilterParamsSerializer(required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+
+class RouteParamsSerializer(serializers.Serializer):
+    """
+    The courier's current position, where the route starts (optional).
+    """
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
+
+    def validate(self, data):
+        if ('lat' in data) != ('lng' in data):
+            raise serializers.ValidationError("Pass both lat and lng, or neither.")
+        return data
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
         fields = ['id', 'product', 'image', 'caption']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    throughput = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id',
+            'upsert',
+            'status',
+            'rows_processed',
+            'rows_imported',
+            'throughput',
+            'messages',
+            'error',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .caching import invalidate_reference_cache
+from .models import City, Courier, CourierProductRemoval, Product, Region, advance_revision, next_product_revision
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def reference_data_changed(sender, using, **kwargs):
+    # Product list ETags include the reference counter (see caching.product_list_etag).
+    advance_revision('reference', using)
+    invalidate_reference_cache()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, using, **kwargs):
+    # Advance the revision even for unassigned products: product list ETags are built from it.
+    revision = next_product_revision(using)
+    if instance.assigned_to_id is not None:
+        CourierProductRemoval.objects.using(using).create(
+            courier_id=instance.assigned_to_id, product_id=instance.pk, revision=revision)
+
+
+def stamp_products(products, using):
+    """
+    Gives products a new revision, for changes to them that don't go through
+    ProductQuerySet.update: the SET_NULL cascades of a delete and the names of their city
+    and region. Delta sync then sends them again and list ETags change.
+    """
+    products = products.using(using)
+    if products.exists():
+        products.update(revision=next_product_revision(using))
+
+
+@receiver(pre_delete, sender=Courier)
+def courier_deleted(sender, instance, using, **kwargs):
+    stamp_products(Product.objects.filter(assigned_to=instance), using)
+
+
+@receiver(post_save, sender=Region)
+@receiver(pre_delete, sender=Region)
+@receiver(post_save, sender=City)
+@receiver(pre_delete, sender=City)
+def reference_data_rewritten(sender, instance, using, created=False, **kwargs):
+    # Products show the name of their region and city, and lose them when one is deleted.
+    if not created:
+        field = 'region' if sender is Region else 'city'
+        stamp_products(Product.objects.filter(**{field: instance}), using)
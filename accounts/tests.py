@@ -1,3 +1,1418 @@
-from django.test import TestCase
+import csv
+import datetime
+import decimal
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import Count
+from django.forms import modelformset_factory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .benchmarks import (
+    compare_product_list_serialization,
+    generate_manifest,
+    generate_manifest_rows,
+    hot_product_queries,
+    measure_import,
+    query_plans,
+    seed_product_table,
+)
+from . import order_status
+from .admin import ProductAdmin
+from .admin_site import admin_site
+from .assignment import plan_assignment
+from .caching import reference_cache
+from .forms import ProductForm
+from .models import City, Courier, ImportJob, ImportJournal, Product, Region, User
+from .serializers import CitySerializer, ProductSerializer
+from . import jobs, routing, utils
+from .utils import (
+    MANIFEST_FIELDS, CityMatcher, ImportRowError, get_or_create_normalized_city, import_products_from_excel,
+    iter_manifest_rows, normalize_rows, normalize_rows_vectorized, sniff_manifest_format,
+)
+
+
+class NormalizeRowsVectorizedTests(SimpleTestCase):
+    rows = [
+        (1, '确认订单', '2025-01-06 23:59:34', 'A1', '1,25', 'x', 'y', 'Addr', 'Toshkent/YUNUSOBOD tumani',
+         'T/Toshkent shahri', 901234567),
+        (2, '', '2025-1-6 3:5:4', 123, 2.0, 'x', 'y', None, "Buxoro/g'ijduvon TUMANI", 'Buxoro viloyati',
+         '+998901234567'),
+        (3, '', '0999-01-01 00:00:00', 12.5, None, 'x', 'y', 5, 'a/b/c', None, ' 93 '),
+        (4, '', 'bad', 'A4', '1,5', 'x', 'y', 'Addr', '  ', '', None),
+        (5, '', datetime.datetime(2025, 1, 1), 'A5', '1,5', 'x', 'y', 'Addr', None, 5, 9.0e8),
+        (6, '', '2025-01-06 23:59:34', 'A6', 'abc', 'x', 'y', 'Addr', 'Samarqand', 'Samarqand', 1),
+        (7, '', '2025-01-06 23:59:34', None, True, 'x', 'y', 'Addr', '/', '/'),
+    ]
+
+    @staticmethod
+    def comparable(normalized):
+        return [
+            ('error', str(row)) if isinstance(row, ImportRowError)
+            else [(key, repr(value)) for key, value in row.items()]
+            for row in normalized
+        ]
+
+    def test_matches_row_by_row_normalization(self):
+        self.assertEqual(
+            self.comparable(normalize_rows_vectorized(self.rows)),
+            self.comparable(normalize_rows(self.rows)),
+        )
+
+    def test_chunk_without_parsable_dates(self):
+        for dates in (['bad', '2025-13-01 00:00:00', None], [datetime.datetime(2025, 1, 1)] * 2):
+            with self.subTest(dates):
+                rows = [(i, '', date, f'D{i}', '1', 'x', 'y', 'Addr', 'A', 'B', '1') for i, date in enumerate(dates)]
+                normalized = normalize_rows_vectorized(rows)
+                self.assertTrue(all(isinstance(row, ImportRowError) for row in normalized))
+                self.assertEqual(self.comparable(normalized), self.comparable(normalize_rows(rows)))
+
+    def test_nan_cells(self):
+        nan = float('nan')
+        rows = [
+            (1, '', '2025-01-06 23:59:34', 'N1', nan, 'x', 'y', 'Addr', 'A', 'B', '1'),
+            (2, '', '2025-01-06 23:59:34', nan, '1', 'x', 'y', nan, nan, nan, nan),
+            (3, '', nan, 'N3', '1', 'x', 'y', 'Addr', 'A', 'B', '1'),
+        ]
+        self.assertEqual(self.comparable(normalize_rows_vectorized(rows)), self.comparable(normalize_rows(rows)))
+        self.assertIsInstance(normalize_rows(rows)[0], ImportRowError)
+
+    def test_empty_chunk(self):
+        self.assertEqual(normalize_rows_vectorized([]), [])
+
+
+class CityMatcherTests(TestCase):
+    existing = ["Yangi chilonzor", "Yunusobod tumani", "Mirzo Ulug'bek tumani"]
+    names = [
+        "Chilonzor tumani", "Yunusobod tumanii", "chilonzor tumani 2", " CHILONZOR TUMANI ", "Sergeli",
+        "Yunusobod tumani", "Sergeli tumani", "sergeli", "Mirzo Ulugbek", "Chilonzor tumani", "Bektemir",
+    ]
+
+    def regions(self, *names):
+        regions = []
+        for name in names:
+            region = Region.objects.create(name=name)
+            City.objects.bulk_create([City(name=city, region=region) for city in self.existing])
+            regions.append(region)
+        return regions
+
+    def row_by_row(self, names, region):
+        return [get_or_create_normalized_city(name, region).name for name in names]
+
+    def test_matches_row_by_row_matcher(self):
+        expected_region, batch_region, single_region = self.regions("Expected", "Batch", "Single")
+        expected = self.row_by_row(self.names, expected_region)
+
+        matcher = CityMatcher()
+        self.assertEqual([city.name for city in matcher.match_many([(name, batch_region) for name in self.names])],
+                         expected)
+        matcher = CityMatcher()
+        self.assertEqual([matcher.match(name, single_region).name for name in self.names], expected)
+        self.assertEqual(
+            sorted(City.objects.filter(region=batch_region).values_list('name', flat=True)),
+            sorted(City.objects.filter(region=expected_region).values_list('name', flat=True)),
+        )
+
+    def test_city_created_later_beats_cached_match(self):
+        expected_region, region = self.regions("Expected", "Matcher")
+        names = ["Chilonzor tumani", "Chilonzor tumani 2", "Chilonzor tumani"]
+        expected = self.row_by_row(names, expected_region)
+        self.assertEqual(expected, ["Yangi chilonzor", "Chilonzor tumani 2", "Chilonzor tumani 2"])
+
+        matcher = CityMatcher()
+        first = matcher.match(names[0], region)
+        with self.assertNumQueries(2):  # only the INSERT of the new city and the reference counter
+            created = matcher.match(names[1], region)
+        with self.assertNumQueries(0):
+            again = matcher.match(names[2], region)
+        self.assertEqual([first.name, created.name, again.name], expected)
+        self.assertEqual(again, created)
+
+    def test_regions_are_indexed_separately_and_once(self):
+        first, second = self.regions("First", "Second")
+        matcher = CityMatcher()
+        with self.assertNumQueries(2):  # one index load per region
+            cities = matcher.match_many([("Yunusobod tumani", first), ("yunusobod tumani", second)] * 3)
+        self.assertEqual({city.region_id for city in cities[::2]}, {first.pk})
+        self.assertEqual({city.region_id for city in cities[1::2]}, {second.pk})
+
+
+class ManifestReaderTests(SimpleTestCase):
+    rows = [
+        ('1', '确认订单', '2025-01-06 23:59:34', 'M1', '1,25', 'Toy', '玩具', 'Street 1', 'T/Yunusobod', 'Toshkent', '901'),
+        ('2', None, '2025-01-07 10:00:00', 'M2', '2', None, None, 'Street 2', 'Buxoro', 'Buxoro', None),
+    ]
+
+    def csv_manifest(self):
+        return io.BytesIO(
+            '\ufeffserial,status,date,order,weight,name,name_cn,address,city,region,phone\n'
+            '1,确认订单,2025-01-06 23:59:34,M1,"1,25",Toy,玩具,Street 1,T/Yunusobod,Toshkent,901\n'
+            '2,,2025-01-07 10:00:00,M2,2,,,Street 2,Buxoro,Buxoro,\n'.encode())
+
+    def test_sniffs_format(self):
+        cases = {
+            'xlsx': generate_manifest(1, fmt='xlsx'),
+            'csv': self.csv_manifest(),
+            'ndjson': io.BytesIO(b'\xef\xbb\xbf\n  {"order_number": "M1"}\n'),
+            'parquet': io.BytesIO(b'PAR1' + b'\0' * 10),
+        }
+        for expected, upload in cases.items():
+            with self.subTest(expected):
+                upload.read(3)
+                self.assertEqual(sniff_manifest_format(upload), expected)
+                self.assertEqual(upload.tell(), 0)
+        self.assertEqual(sniff_manifest_format(io.BytesIO(b'[["1", "", "x"]]')), 'ndjson')
+
+    def test_rejects_legacy_xls(self):
+        with self.assertRaisesMessage(ValueError, "Legacy .xls files are not supported; save the file as .xlsx or CSV."):
+            list(iter_manifest_rows(io.BytesIO(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 100)))
+
+    def test_csv_empty_fields_are_none(self):
+        upload = self.csv_manifest()
+        self.assertEqual(list(iter_manifest_rows(upload)), self.rows)
+        self.assertFalse(upload.closed)
+
+    def test_ndjson_objects_and_arrays(self):
+        objects = [
+            json.dumps({field: value for field, value in zip(MANIFEST_FIELDS, row) if value is not None},
+                       ensure_ascii=False)
+            for row in self.rows
+        ]
+        arrays = [json.dumps(list(row), ensure_ascii=False) for row in self.rows]
+        for lines in (objects, arrays, [objects[0], '', arrays[1]]):
+            with self.subTest(lines[0][0]):
+                upload = io.BytesIO('\n'.join(lines).encode())
+                self.assertEqual(list(iter_manifest_rows(upload)), self.rows)
+
+    def test_parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        output = io.BytesIO()
+        table = pyarrow.table({field: [row[i] for row in self.rows] for i, field in enumerate(MANIFEST_FIELDS)})
+        pyarrow.parquet.write_table(table, output, row_group_size=1)
+        output.seek(0)
+        self.assertEqual(list(iter_manifest_rows(output)), self.rows)
+
+    def test_formats_import_alike(self):
+        xlsx_rows = list(iter_manifest_rows(generate_manifest(20, fmt='xlsx', seed=2)))
+        csv_rows = list(iter_manifest_rows(generate_manifest(20, fmt='csv', seed=2)))
+        self.assertEqual(normalize_rows(csv_rows), normalize_rows(xlsx_rows))
+
+
+class ImportBenchmarkTests(TestCase):
+    """
+    Small-scale runs of the import benchmark (see the benchmark_import command for full size).
+    They guard against regressions back to per-row queries.
+    """
+    rows = 2000
+
+    def assert_import_is_batched(self, stats):
+        self.assertEqual(stats['summary'], f"Imported {Product.objects.count()} products successfully.")
+        self.assertGreater(stats['rows_per_second'], 0)
+        self.assertLess(stats['queries_per_row'], 0.1)
+        self.assertLessEqual(stats['fuzzy_seconds'], stats['seconds'])
+
+    def test_xlsx_import(self):
+        self.assert_import_is_batched(measure_import(generate_manifest(self.rows, fmt='xlsx'), self.rows))
+
+    def test_csv_import_vectorized(self):
+        self.assert_import_is_batched(
+            measure_import(generate_manifest(self.rows, fmt='csv'), self.rows, vectorized=True))
+
+    def test_reimport_only_checks_for_duplicates(self):
+        measure_import(generate_manifest(self.rows, fmt='csv'), self.rows)
+        city_count = City.objects.count()
+        stats = measure_import(generate_manifest(self.rows, fmt='csv'), self.rows, resume=False)
+        self.assertEqual(stats['summary'], "Imported 0 products successfully.")
+        self.assertEqual(City.objects.count(), city_count)
+        self.assertLess(stats['queries_per_row'], 0.01)
+
+
+class ImportJournalTests(TestCase):
+    def test_resubmitted_file_resumes_after_last_committed_chunk(self):
+        manifest = generate_manifest(250, fmt='csv', duplicate_rate=0)
+        write_product_chunk = utils.write_product_chunk
+        written_chunks = []
+
+        def failing_write(rows, *args, **kwargs):
+            written_chunks.append(rows[0]['order_number'])
+            if len(written_chunks) == 2:
+                raise RuntimeError("worker restarted")
+            return write_product_chunk(rows, *args, **kwargs)
+
+        with mock.patch.object(utils, 'write_product_chunk', failing_write):
+            with self.assertRaises(RuntimeError):
+                import_products_from_excel(manifest, chunk_size=100)
+        self.assertEqual(Product.objects.count(), 100)
+        self.assertEqual(ImportJournal.objects.get().rows_committed, 100)
+
+        with mock.patch.object(utils, 'write_product_chunk', wraps=write_product_chunk) as resumed_write:
+            messages = import_products_from_excel(manifest, chunk_size=100)
+        self.assertEqual(resumed_write.call_count, 2)
+        self.assertEqual(messages[0], "Resuming import after 100 already processed rows.")
+        self.assertEqual(messages[-1], "Imported 150 products successfully.")
+        self.assertEqual(Product.objects.count(), 250)
+
+    def test_completed_file_is_imported_again(self):
+        manifest = generate_manifest(20, fmt='csv', duplicate_rate=0)
+        import_products_from_excel(manifest)
+        Product.objects.filter(pk__in=Product.objects.order_by('pk').values('pk')[:5]).delete()
+
+        messages = import_products_from_excel(manifest)
+        self.assertEqual(sum("already exists" in message for message in messages), 15)
+        self.assertEqual(messages[-1], "Imported 5 products successfully.")
+        self.assertEqual(Product.objects.count(), 20)
+        journal = ImportJournal.objects.get()
+        self.assertEqual((journal.rows_committed, journal.completed, journal.claimed_by), (20, True, None))
+
+    def test_concurrent_import_of_the_same_file_is_refused(self):
+        manifest = generate_manifest(250, fmt='csv', duplicate_rate=0)
+        write_product_chunk = utils.write_product_chunk
+        refused = []
+
+        def write_and_resubmit(rows, *args, **kwargs):
+            # A double-submitted upload starts while the first import is writing.
+            if not refused:
+                with self.assertRaisesMessage(ValueError, "already being imported"):
+                    import_products_from_excel(io.BytesIO(manifest.getvalue()), chunk_size=100)
+                refused.append(True)
+            return write_product_chunk(rows, *args, **kwargs)
+
+        with mock.patch.object(utils, 'write_product_chunk', write_and_resubmit):
+            import_products_from_excel(manifest, chunk_size=100)
+        self.assertEqual(Product.objects.count(), 250)
+        self.assertEqual(ImportJournal.objects.get().rows_committed, 250)
+
+    def test_abandoned_claim_is_taken_over(self):
+        manifest = generate_manifest(10, fmt='csv', duplicate_rate=0)
+        journal, token = utils.claim_import_journal(utils.file_sha256(manifest), False)
+        with self.assertRaises(ValueError):
+            import_products_from_excel(manifest)
+
+        ImportJournal.objects.filter(pk=journal.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(seconds=601))
+        self.assertEqual(import_products_from_excel(manifest)[-1], "Imported 10 products successfully.")
+        # The abandoned import can no longer checkpoint.
+        self.assertFalse(ImportJournal.objects.filter(pk=journal.pk, claimed_by=token).exists())
+
+
+class ImportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploader = User.objects.create_user('uploader', 'password', full_name="Uploader", role='Operator')
+        cls.other = User.objects.create_user('other', 'password', full_name="Other", role='Operator')
+        cls.admin = User.objects.create_user('admin', 'password', full_name="Admin", role='Admin')
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+
+    def job(self, content, **kwargs):
+        return ImportJob.objects.create(
+            file=SimpleUploadedFile('manifest.csv', content), created_by=self.uploader, **kwargs)
+
+    def test_upload_returns_202_and_completes(self):
+        manifest = generate_manifest(30, fmt='csv', duplicate_rate=0)
+        self.client.force_authenticate(self.uploader)
+        with mock.patch.object(jobs._executor, 'submit', lambda function, job_id: jobs.run_import_job(job_id)), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/accounts/upload/', manifest.read(), content_type='text/csv',
+                HTTP_CONTENT_DISPOSITION='attachment; filename=manifest.csv')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'Pending')
+
+        data = self.client.get(f"/api/accounts/imports/{response.json()['id']}/").json()
+        self.assertEqual(data['status'], 'Completed')
+        self.assertEqual((data['rows_processed'], data['rows_imported']), (30, 30))
+        self.assertEqual(data['messages'][-1], "Imported 30 products successfully.")
+        self.assertIsNone(data['error'])
+        self.assertIsNotNone(data['finished_at'])
+        self.assertEqual(Product.objects.count(), 30)
+
+    def test_uploaded_file_is_deleted_when_the_job_completes(self):
+        completed = self.job(generate_manifest(5, fmt='csv', duplicate_rate=0).read())
+        failed = self.job(b'\xd0\xcf\x11\xe0' + b'\0' * 100)
+        storage, completed_name, failed_name = completed.file.storage, completed.file.name, failed.file.name
+        for job in (completed, failed):
+            jobs.run_import_job(job.pk)
+            job.refresh_from_db()
+        self.assertEqual((completed.status, failed.status), ('Completed', 'Failed'))
+        self.assertFalse(completed.file)
+        self.assertFalse(storage.exists(completed_name))
+        self.assertTrue(storage.exists(failed_name))
+
+    def test_failed_job_records_the_error(self):
+        job = self.job(b'\xd0\xcf\x11\xe0' + b'\0' * 100)
+        jobs.run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Failed')
+        self.assertIn("Legacy .xls files are not supported", job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_status_is_visible_to_creator_and_admins_only(self):
+        url = f'/api/accounts/imports/{self.job(b"").pk}/'
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        for user, expected in ((self.uploader, 200), (self.admin, 200), (self.other, 404)):
+            with self.subTest(user.username):
+                self.client.force_authenticate(user)
+                self.assertEqual(self.client.get(url).status_code, expected)
+
+    def test_admin_status_page_is_visible_to_creator_and_admins_only(self):
+        url = f'/admin/accounts/product/import-excel/{self.job(b"").pk}/'
+        for user, expected in ((self.uploader, 200), (self.admin, 200), (self.other, 404)):
+            with self.subTest(user.username):
+                self.client.force_login(user)
+                self.assertEqual(self.client.get(url).status_code, expected)
+
+    def test_recover_interrupted_jobs(self):
+        manifest = generate_manifest(5, fmt='csv', duplicate_rate=0).read()
+        self.job(manifest)
+        self.job(manifest, status='Running')
+        finished = self.job(manifest, status='Completed')
+        call_command('recover_import_jobs', stdout=io.StringIO())
+        self.assertEqual(
+            list(ImportJob.objects.order_by('pk').values_list('status', flat=True)), ['Completed'] * 3)
+        self.assertEqual(Product.objects.count(), 5)
+
+        self.job(manifest)
+        call_command('recover_import_jobs', mark_failed=True, stdout=io.StringIO())
+        self.assertEqual(ImportJob.objects.filter(status='Failed').count(), 1)
+        self.assertEqual(ImportJob.objects.get(pk=finished.pk).status, 'Completed')
+
+
+class UpsertImportTests(TestCase):
+    def manifest(self, rows):
+        header = ",".join(["#"] * 11)
+        lines = [
+            f"{i},确认订单,2025-01-06 23:59:34,{order},\"{weight}\",x,y,{address},Toshkent/Yunusobod tumani,"
+            f"T/Toshkent shahri,901234567"
+            for i, (order, weight, address) in enumerate(rows)
+        ]
+        return io.BytesIO("\n".join([header] + lines).encode())
+
+    def test_upsert_updates_only_changed_products(self):
+        import_products_from_excel(self.manifest([
+            ('A1', '1,5', 'Street 1'), ('A2', '2,25', 'Street 2'), ('A3', '3', 'Street 3'),
+        ]))
+        messages = import_products_from_excel(self.manifest([
+            ('A1', '1,50', 'Street 1'), ('A2', '2,25', 'New street'), ('A3', '4', 'Street 3'), ('A4', '1', 'Street 4'),
+        ]), upsert=True)
+
+        self.assertEqual(messages, ["Imported 1 products, updated 2, 1 unchanged."])
+        self.assertEqual(
+            dict(Product.objects.values_list('order_number', 'address')),
+            {'A1': 'Street 1', 'A2': 'New street', 'A3': 'Street 3', 'A4': 'Street 4'},
+        )
+        self.assertEqual(Product.objects.get(order_number='A3').weight, decimal.Decimal('4.00'))
+
+    def test_plain_reimport_keeps_existing_products(self):
+        import_products_from_excel(self.manifest([('A1', '1', 'Street 1')]))
+        messages = import_products_from_excel(self.manifest([('A1', '1', 'Changed')]), resume=False)
+        self.assertEqual(messages, ["Product A1 already exists.", "Imported 0 products successfully."])
+        self.assertEqual(Product.objects.get().address, 'Street 1')
+
+
+class ProductListQueryCountTests(TestCase):
+    """
+    Product lists must cost a fixed number of queries, however many products they return.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name="Toshkent shahri")
+        cls.cities = [City.objects.create(name=f"Tuman {i}", region=region) for i in range(3)]
+        cls.admin = User.objects.create_superuser('admin', 'password', full_name="Admin", role='Admin')
+        courier_user = User.objects.create_user('courier', 'password', full_name="Courier", role='Courier')
+        cls.courier = Courier.objects.create(user=courier_user)
+        cls.courier.covered_cities.set(cls.cities)
+
+    def add_products(self, count):
+        start = Product.objects.count()
+        Product.objects.bulk_create([
+            Product(
+                order_number=f"Q{start + i}",
+                weight=1,
+                address="Street",
+                phone_number="+998901234567",
+                region=self.cities[0].region,
+                city=self.cities[i % 3],
+                assigned_to=self.courier if i % 2 else None,
+            )
+            for i in range(count)
+        ])
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant_queries(self, client, url):
+        self.add_products(4)
+        few = self.count_queries(client, url)
+        self.add_products(16)
+        self.assertEqual(self.count_queries(client, url), few)
+
+    def test_product_list(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assert_constant_queries(client, '/api/accounts/products/')
+
+    def test_courier_product_list(self):
+        client = APIClient()
+        client.force_authenticate(self.courier.user)
+        self.assert_constant_queries(client, '/api/accounts/courier/products/')
+
+    def test_admin_changelist(self):
+        self.client.force_login(self.admin)
+        self.assert_constant_queries(self.client, '/admin/accounts/product/')
+
+
+class ProductKeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name="Toshkent shahri")
+        city = City.objects.create(name="Yunusobod tumani", region=region)
+        cls.admin = User.objects.create_superuser('admin', 'password', full_name="Admin", role='Admin')
+        Product.objects.bulk_create([
+            Product(
+                order_number=f"K{i}",
+                date=datetime.date(2025, 1, 1 + i % 3),
+                weight=1,
+                address="Street",
+                phone_number="+998901234567",
+                region=region,
+                city=city,
+            )
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_pages_cover_all_products_newest_first(self):
+        url, seen, page_queries = '/api/accounts/products/?page_size=4', [], set()
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            page_queries.add(len(queries))
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 4)
+            seen.extend((product['date'], product['id']) for product in page['results'])
+            url = page['next']
+
+        expected = [
+            (day.isoformat(), pk)
+            for day, pk in Product.objects.order_by('-date', '-id').values_list('date', 'id')
+        ]
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(page_queries), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/accounts/products/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Asserts on SQLite's EXPLAIN QUERY PLAN output.")
+class ProductQueryPlanTests(TestCase):
+    """
+    The hot Product queries must be index searches, not table scans, on a populated and analyzed
+    table. See the benchmark_product_queries command for the same check at full size.
+    """
+    expected_indexes = {
+        'product_list': 'product_date_id_idx',
+        'product_list_deep_page': 'product_date_id_idx (date<?)',
+        'courier_list': 'product_courier_date_idx (assigned_to_id=?)',
+        'courier_list_deep_page': 'product_courier_date_idx (assigned_to_id=? AND date<?)',
+        'courier_open_products': 'product_courier_status_idx (assigned_to_id=? AND order_status=?)',
+        'admin_status_filter': 'product_status_date_idx (order_status=?)',
+        'admin_region_filter': '(region_id=?)',
+        'admin_city_filter': '(city_id=?)',
+        'admin_unassigned_filter': '(assigned_to_id=?)',
+        'import_dedupe': '(order_number=?)',
+        'api_order_number_prefix': 'sqlite_autoindex_accounts_product_1 (order_number>? AND order_number<?)',
+    }
+    # Selective searches whose few matching rows are then sorted for the default ordering.
+    sorted_after_search = {'api_order_number_prefix'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region, cls.cities, cls.couriers = seed_product_table(5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_hot_queries_use_indexes(self):
+        order_numbers = [f"SEED-000-{serial:09d}" for serial in range(0, 5000, 50)]
+        plans = query_plans(hot_product_queries(self.couriers[0], self.region, self.cities[0], order_numbers))
+        for name, index in self.expected_indexes.items():
+            with self.subTest(name):
+                self.assertIn("INDEX", plans[name])
+                self.assertIn(index, plans[name])
+                if name not in self.sorted_after_search:
+                    self.assertNotIn("TEMP B-TREE", plans[name])
+
+
+class ReferenceCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name="Toshkent shahri")
+        City.objects.create(name="Yunusobod tumani", region=cls.region)
+        City.objects.create(name="Chilonzor tumani", region=cls.region)
+
+    def setUp(self):
+        reference_cache().clear()
+        self.client = APIClient()
+
+    def test_city_list_matches_serializer(self):
+        response = self.client.get('/api/accounts/cities/')
+        self.assertEqual(response.json(), CitySerializer(City.objects.order_by('pk'), many=True).data)
+
+    def test_cached_list_and_not_modified(self):
+        first = self.client.get('/api/accounts/cities/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/accounts/cities/')
+            not_modified = self.client.get('/api/accounts/cities/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+    def test_saving_a_city_or_region_invalidates(self):
+        etag = self.client.get('/api/accounts/cities/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            City.objects.create(name="Sergeli tumani", region=self.region)
+        response = self.client.get('/api/accounts/cities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+        etag = self.client.get('/api/accounts/regions/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.region.delete()
+        response = self.client.get('/api/accounts/regions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json(), [])
+        self.assertEqual(self.client.get('/api/accounts/cities/').json(), [])
+
+    def test_missed_invalidation_expires(self):
+        # A change another process made: its invalidation never reaches this process's cache.
+        with self.settings(REFERENCE_CACHE_TIMEOUT=1):
+            etag = self.client.get('/api/accounts/cities/')['ETag']
+            City.objects.filter(name="Chilonzor tumani").update(name="Sergeli tumani")
+            self.assertEqual(self.client.get('/api/accounts/cities/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            time.sleep(1.1)
+            response = self.client.get('/api/accounts/cities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Sergeli tumani", [city['name'] for city in response.json()])
+
+
+class ProductFastListTests(TestCase):
+    """
+    The product list fast path must render exactly what ProductSerializer and JSONRenderer do.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'password', full_name="Admin", role='Admin')
+        region = Region.objects.create(name="Farg'ona viloyati")
+        city = City.objects.create(name="Qo‘qon shahri   \"quoted\"", region=region)
+        courier_user = User.objects.create_user('courier', 'password', full_name="Courier", role='Courier')
+        cls.courier = Courier.objects.create(user=courier_user)
+        Product.objects.create(
+            name="手机壳   tab\there", order_number="F1", weight=decimal.Decimal('12.5'), address="Ko‘cha\x01",
+            phone_number="+998901234567", region=region, city=city, assigned_to=cls.courier)
+        Product.objects.create(order_number="F2", weight=0, address="Street\u2028line", phone_number="1")
+
+    def test_product_list_matches_serializer(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/accounts/products/')
+        expected = JSONRenderer().render({
+            'next': None,
+            'results': ProductSerializer(Product.objects.order_by('-date', '-id'), many=True).data,
+        })
+        self.assertEqual(response.content, expected)
+
+    def test_benchmark_paths_render_identical_bytes(self):
+        stats = compare_product_list_serialization(Product.objects.order_by('-date', '-id'), repeat=1)
+        self.assertTrue(stats['identical'])
+        self.assertEqual(stats['rows'], 2)
+
+
+class CourierProductChangesTests(TestCase):
+    url = '/api/accounts/courier/products/changes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name="Toshkent shahri")
+        cls.city = City.objects.create(name="Yunusobod tumani", region=cls.region)
+        cls.couriers = [
+            Courier.objects.create(user=User.objects.create_user(
+                f'courier{i}', 'password', full_name=f"Courier {i}", role='Courier'))
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.couriers[0].user)
+        self.products = [
+            Product.objects.create(
+                order_number=f"D{i}", weight=1, address="Street", phone_number="+998901234567",
+                region=self.region, city=self.city, assigned_to=self.couriers[0])
+            for i in range(5)
+        ]
+
+    def changes(self, since=None):
+        response = self.client.get(self.url, {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['id'] for row in data['changed']], data['removed'], data['next']
+
+    def test_full_sync_then_deltas(self):
+        changed, removed, cursor = self.changes()
+        self.assertEqual(sorted(changed), [product.pk for product in self.products])
+        self.assertEqual(self.changes(cursor), ([], [], cursor))
+
+        edited, unassigned, reassigned, deleted = self.products[:4]
+        edited.address = "New street"
+        edited.save()
+        Product.objects.filter(pk=unassigned.pk).update(assigned_to=None)
+        reassigned.assigned_to = self.couriers[1]
+        reassigned.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        added = Product.objects.create(
+            order_number="D9", weight=1, address="Street", phone_number="1", assigned_to=self.couriers[0])
+
+        changed, removed, next_cursor = self.changes(cursor)
+        self.assertEqual(changed, [edited.pk, added.pk])
+        self.assertEqual(removed, sorted([unassigned.pk, reassigned.pk, deleted_pk]))
+        self.assertEqual(self.changes(next_cursor), ([], [], next_cursor))
+
+    def test_bulk_writes_are_tracked(self):
+        cursor = self.changes()[2]
+        for product in self.products[:2]:
+            product.weight = 7
+        Product.objects.bulk_update(self.products[:2], ['weight'])
+        self.assertEqual(self.changes(cursor)[0], [self.products[0].pk, self.products[1].pk])
+
+    def test_product_reassigned_back_is_not_removed(self):
+        cursor = self.changes()[2]
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(assigned_to=self.couriers[1])
+        Product.objects.filter(pk=product.pk).update(assigned_to=self.couriers[0])
+        self.assertEqual(self.changes(cursor)[:2], ([product.pk], []))
+
+    def test_city_and_region_changes_are_tracked(self):
+        cursor = self.changes()[2]
+        other_city = City.objects.create(name="Chilonzor tumani", region=self.region)
+        Product.objects.filter(pk=self.products[0].pk).update(city=other_city)
+        cursor = self.changes(cursor)[2]
+
+        self.city.name = "Yunusobod"
+        self.city.save()
+        changed, _, cursor = self.changes(cursor)
+        self.assertEqual(changed, [product.pk for product in self.products[1:]])
+
+        other_city.delete()
+        response = self.client.get(self.url, {'since': cursor}).json()
+        self.assertEqual([(row['id'], row['city']) for row in response['changed']], [(self.products[0].pk, None)])
+
+        self.region.delete()
+        response = self.client.get(self.url, {'since': response['next']}).json()
+        self.assertEqual(len(response['changed']), 5)
+        self.assertEqual({(row['region'], row['city']) for row in response['changed']}, {(None, None)})
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'nope'}).status_code, 404)
+
+
+class ProductListConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        courier_user = User.objects.create_user('courier', 'password', full_name="Courier", role='Courier')
+        cls.courier = Courier.objects.create(user=courier_user)
+        cls.other_courier = Courier.objects.create(user=User.objects.create_user(
+            'other', 'password', full_name="Other", role='Courier'))
+        cls.products = [
+            Product.objects.create(
+                order_number=f"C{i}", weight=1, address="Street", phone_number="1", assigned_to=cls.courier)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier.user)
+
+    def test_unchanged_list_is_not_modified(self):
+        url = '/api/accounts/courier/products/'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertFalse([query['sql'] for query in queries if 'accounts_product"' in query['sql']])
+
+    def test_etag_is_not_shared_between_couriers(self):
+        url = '/api/accounts/courier/products/'
+        response = self.client.get(url)
+        self.assertIn('Authorization', response['Vary'])
+
+        self.client.force_authenticate(self.other_courier.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+        self.client.force_authenticate(self.courier.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_etag_is_the_same_in_every_process(self):
+        url = '/api/accounts/courier/products/'
+        etag = self.client.get(url)['ETag']
+        # Another worker process has its own (here: empty) local-memory cache.
+        reference_cache().clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_page_requests_do_not_scan_the_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/accounts/courier/products/')
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql'] or 'MAX(' in query['sql']])
+
+    def test_changes_invalidate_the_etag(self):
+        url = '/api/accounts/courier/products/'
+        etag = self.client.get(url)['ETag']
+
+        self.products[0].address = "Changed"
+        self.products[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        Product.objects.filter(pk=self.products[1].pk).update(assigned_to=self.other_courier)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+        etag = response['ETag']
+        self.assertNotEqual(self.client.get(url + '?page_size=1', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_deletes_and_reference_changes_invalidate_the_etag(self):
+        unassigned = Product.objects.create(order_number="U1", weight=1, address="Street", phone_number="1")
+        self.client.force_authenticate(User.objects.create_user('boss', 'password', full_name="Boss",
+                                                                role='Courier Boss'))
+        url = '/api/accounts/products/'
+        etag = self.client.get(url)['ETag']
+        unassigned.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Region.objects.create(name="Renamed")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        revision = Product.objects.get(pk=self.products[0].pk).revision
+        self.other_courier.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.courier.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertGreater(Product.objects.get(pk=self.products[0].pk).revision, revision)
+
+
+class ProductSparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'password', full_name="Admin", role='Admin')
+        region = Region.objects.create(name="Toshkent shahri")
+        city = City.objects.create(name="Yunusobod tumani", region=region)
+        for i in range(5):
+            Product.objects.create(
+                order_number=f"S{i}", weight=i, address="Street", phone_number="1", region=region, city=city)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_only_requested_fields_are_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/accounts/products/?fields=order_number,weight&page_size=2')
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(page['results'], [
+            {'order_number': 'S4', 'weight': '4.00'}, {'order_number': 'S3', 'weight': '3.00'},
+        ])
+        select = next(query['sql'] for query in queries if 'LIMIT' in query['sql'])
+        self.assertNotIn('"address"', select)
+        self.assertNotIn('JOIN', select)
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual([row['order_number'] for row in page['results']], ['S2', 'S1'])
+
+    def test_joined_names_follow_serializer_order(self):
+        response = self.client.get('/api/accounts/products/?fields=city_name,id,region_name')
+        self.assertEqual(list(response.json()['results'][0]), ['id', 'region_name', 'city_name'])
+        self.assertEqual(response.json()['results'][0]['city_name'], "Yunusobod tumani")
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/accounts/products/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ["Unknown fields: secret."]})
+
+
+class ProductExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'password', full_name="Admin", role='Admin')
+        region = Region.objects.create(name="Toshkent shahri")
+        city = City.objects.create(name="Yunusobod tumani", region=region)
+        courier_user = User.objects.create_user('courier', 'password', full_name="Ali Valiyev", role='Courier')
+        courier = Courier.objects.create(user=courier_user)
+        for i, status in enumerate(['Pending', 'Delivered', 'Delivered']):
+            Product.objects.create(
+                order_number=f"E{i}", date=datetime.date(2025, 3, 1), weight=decimal.Decimal('1.5'),
+                address="Ko‘cha, 5", phone_number="+998901234567", region=region, city=city,
+                order_status=status, assigned_to=courier if i else None)
+
+    @staticmethod
+    def read_csv(response):
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_csv_export_streams(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/accounts/products/export/csv/')
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+        with self.assertNumQueries(0):
+            header = next(response.streaming_content)
+        self.assertTrue(header.startswith('\ufeffid,order_number'.encode()))
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(sorted(row[1] for row in rows), ['E0', 'E1', 'E2'])
+        e1 = next(row for row in rows if row[1] == 'E1')
+        self.assertEqual(e1[2:], [
+            '2025-03-01', 'Delivered', '', '1.50', 'Ko‘cha, 5', 'Toshkent shahri', 'Yunusobod tumani',
+            '+998901234567', 'Ali Valiyev', '', '',
+        ])
+
+    def test_admin_export_uses_changelist_filters(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/accounts/product/export/csv/?order_status__exact=Delivered')
+        self.assertEqual(sorted(row[1] for row in self.read_csv(response)[1:]), ['E1', 'E2'])
+
+        response = self.client.get('/admin/accounts/product/export/csv/?assigned=unassigned&q=E')
+        self.assertEqual([row[1] for row in self.read_csv(response)[1:]], ['E0'])
+
+    def test_admin_export_requires_view_permission(self):
+        staff = User.objects.create_user('staff', 'password', full_name="Staff", role='Operator', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/admin/accounts/product/export/csv/').status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_product'))
+        self.assertEqual(self.client.get('/admin/accounts/product/export/csv/').status_code, 200)
+
+    def test_admin_action_exports_xlsx(self):
+        self.client.force_login(self.admin)
+        selected = Product.objects.filter(order_number__in=['E0', 'E2']).values_list('pk', flat=True)
+        response = self.client.post('/admin/accounts/product/', {
+            'action': 'export_selected_xlsx', '_selected_action': list(selected),
+        })
+        self.assertEqual(response.status_code, 200)
+        ws = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:2], ('id', 'order_number'))
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['E0', 'E2'])
+
+
+class ProductFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'password', full_name="Admin", role='Admin')
+        cls.region = Region.objects.create(name="Toshkent shahri")
+        cls.other_region = Region.objects.create(name="Buxoro viloyati")
+        cls.city = City.objects.create(name="Yunusobod tumani", region=cls.region)
+        cls.courier = Courier.objects.create(user=User.objects.create_user(
+            'courier', 'password', full_name="Courier", role='Courier'))
+        rows = [
+            # order_number, status, region, day, weight, courier
+            ('AB-1', 'Pending', cls.region, 1, '3', None),
+            ('AB-2', 'Delivered', cls.region, 2, '1', cls.courier),
+            ('AC-1', 'Delivered', cls.other_region, 3, '2', cls.courier),
+            ('B-1', 'Cancelled', cls.other_region, 4, '2', None),
+        ]
+        for order_number, status, region, day, weight, courier in rows:
+            Product.objects.create(
+                order_number=order_number, order_status=status, region=region,
+                city=cls.city if region == cls.region else None, date=datetime.date(2025, 5, day),
+                weight=decimal.Decimal(weight), address="Street", phone_number="1", assigned_to=courier)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def order_numbers(self, query):
+        response = self.client.get(f'/api/accounts/products/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['order_number'] for row in response.json()['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.order_numbers('status=Delivered,Cancelled'), ['B-1', 'AC-1', 'AB-2'])
+        self.assertEqual(self.order_numbers(f'region={self.region.pk}'), ['AB-2', 'AB-1'])
+        self.assertEqual(self.order_numbers(f'city={self.city.pk}&status=Pending'), ['AB-1'])
+        self.assertEqual(self.order_numbers('assigned=unassigned'), ['B-1', 'AB-1'])
+        self.assertEqual(self.order_numbers(f'courier={self.courier.pk}'), ['AC-1', 'AB-2'])
+        self.assertEqual(self.order_numbers('date_from=2025-05-02&date_to=2025-05-03'), ['AC-1', 'AB-2'])
+        self.assertEqual(self.order_numbers('order_number=AB'), ['AB-2', 'AB-1'])
+
+    def test_invalid_filters(self):
+        for query in ('region=x', 'assigned=maybe', 'date_from=yesterday', 'ordering=address'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/api/accounts/products/?{query}').status_code, 400)
+
+    def test_ordering_paginates_with_cursor(self):
+        url = '/api/accounts/products/?ordering=-weight,order_number&page_size=1&fields=order_number'
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(row['order_number'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, ['AB-1', 'AC-1', 'B-1', 'AB-2'])
+
+
+class BulkConfirmTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.couriers = [
+            Courier.objects.create(user=User.objects.create_user(
+                f'courier{i}', 'password', full_name=f"Courier {i}", role='Courier'))
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.couriers[0].user)
+
+    def product(self, order_number, order_status, courier_index=0):
+        return Product.objects.create(
+            order_number=order_number, order_status=order_status, weight=1, address="Street", phone_number="1",
+            assigned_to=self.couriers[courier_index]).pk
+
+    def test_bulk_receipt_reports_each_id(self):
+        fresh, dispatched, delivered = self.product("R1", "Pending"), self.product("R2", "Dispatched"), \
+            self.product("R3", "Delivered")
+        foreign = self.product("R4", "Pending", courier_index=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/accounts/confirm-receipt/bulk/', {
+                'product_ids': [fresh, dispatched, delivered, foreign, 999999, fresh],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 2, 'results': [
+            {'product_id': fresh, 'outcome': 'ok'},
+            {'product_id': dispatched, 'outcome': 'ok'},
+            {'product_id': delivered, 'outcome': 'wrong_state'},
+            {'product_id': foreign, 'outcome': 'not_assigned'},
+            {'product_id': 999999, 'outcome': 'not_assigned'},
+        ]})
+        self.assertEqual(sum('UPDATE "accounts_product"' in query['sql'] for query in queries), 1)
+        self.assertEqual(
+            dict(Product.objects.values_list('order_number', 'order_status')),
+            {'R1': 'Received', 'R2': 'Received', 'R3': 'Delivered', 'R4': 'Pending'},
+        )
+
+    def test_bulk_delivered_requires_receipt(self):
+        received, fresh = self.product("D1", "Received"), self.product("D2", "Pending")
+        response = self.client.post(
+            '/api/accounts/confirm-delivered/bulk/', {'product_ids': [received, fresh]}, format='json')
+        self.assertEqual([result['outcome'] for result in response.json()['results']], ['ok', 'wrong_state'])
+
+    def test_validation(self):
+        for payload in ({}, {'product_ids': []}, {'product_ids': ['x']}):
+            with self.subTest(payload):
+                response = self.client.post('/api/accounts/confirm-receipt/bulk/', payload, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+class OrderStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.couriers = [
+            Courier.objects.create(user=User.objects.create_user(
+                f'courier{i}', 'password', full_name=f"Courier {i}", role='Courier'))
+            for i in range(2)
+        ]
+
+    def product(self, **kwargs):
+        return Product.objects.create(**{
+            'order_number': "S1", 'weight': 1, 'address': "Street", 'phone_number': "1",
+            'assigned_to': self.couriers[0], **kwargs})
+
+    def test_transition_only_moves_allowed_statuses(self):
+        for status, _ in order_status.STATUS_CHOICES:
+            self.product(order_number=status, order_status=status)
+        moved = order_status.transition(Product.objects.all(), order_status.DELIVERED)
+        self.assertEqual(moved, 2)
+        self.assertEqual(dict(Product.objects.values_list('order_number', 'order_status')), {
+            'Pending': 'Pending', 'Dispatched': 'Delivered', 'Received': 'Delivered',
+            'Delivered': 'Delivered', 'Cancelled': 'Cancelled'})
+
+    def test_transition_product_is_compare_and_set(self):
+        product = self.product()
+        stale = Product.objects.get(pk=product.pk)
+        self.assertTrue(order_status.transition_product(product, order_status.CANCELLED))
+        self.assertFalse(order_status.transition_product(stale, order_status.DISPATCHED))
+        self.assertEqual(Product.objects.get(pk=product.pk).order_status, order_status.CANCELLED)
+        with self.assertRaises(order_status.InvalidTransition):
+            order_status.transition_product(product, order_status.PENDING)
+
+    def test_confirm_receipt_rejects_terminal_status(self):
+        product = self.product(order_status=order_status.DELIVERED)
+        client = APIClient()
+        client.force_authenticate(self.couriers[0].user)
+        response = client.post('/api/accounts/confirm-receipt/', {'product_id': product.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.get(pk=product.pk).order_status, order_status.DELIVERED)
+
+    def test_serializer_update_keeps_concurrent_status_change(self):
+        product = self.product()
+        stale = Product.objects.get(pk=product.pk)
+        order_status.transition_product(product, order_status.CANCELLED)
+
+        serializer = ProductSerializer(stale, data={'name': "Renamed"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(
+            Product.objects.values_list('name', 'order_status').get(pk=product.pk), ("Renamed", 'Cancelled'))
+
+        serializer = ProductSerializer(stale, data={'order_status': 'Dispatched'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).order_status, order_status.CANCELLED)
+
+    def test_admin_list_editable_keeps_concurrent_status_change(self):
+        product = self.product()
+        FormSet = modelformset_factory(Product, form=ProductForm, fields=['order_status', 'assigned_to'], extra=0)
+        model_admin = ProductAdmin(Product, admin_site)
+
+        def bound_form(**data):
+            formset = FormSet({
+                'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1', 'form-0-id': str(product.pk),
+                'form-0-order_status': 'Pending', 'form-0-assigned_to': str(self.couriers[0].pk),
+                **{f'form-0-{name}': value for name, value in data.items()},
+            }, queryset=Product.objects.filter(pk=product.pk))
+            self.assertTrue(formset.is_valid(), formset.errors)
+            return formset.forms[0]
+
+        reassign = bound_form(assigned_to=str(self.couriers[1].pk))
+        dispatch = bound_form(order_status='Dispatched')
+        order_status.transition_product(product, order_status.CANCELLED)
+
+        model_admin.save_product_form(reassign)
+        with self.assertRaises(ValueError):
+            model_admin.save_product_form(dispatch)
+        self.assertEqual(
+            Product.objects.values_list('assigned_to', 'order_status').get(pk=product.pk),
+            (self.couriers[1].pk, 'Cancelled'))
+
+        formset = FormSet({
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1', 'form-0-id': str(product.pk),
+            'form-0-order_status': 'Pending', 'form-0-assigned_to': str(self.couriers[1].pk),
+        }, queryset=Product.objects.filter(pk=product.pk))
+        self.assertFalse(formset.is_valid())
+        self.assertIn('order_status', formset.forms[0].errors)
+
+
+class OrderStatusConcurrencyTests(TransactionTestCase):
+    writers = 8
+
+    def test_parallel_writers_do_not_lose_updates(self):
+        product = Product.objects.create(order_number="C1", weight=1, address="Street", phone_number="1")
+        targets = [order_status.DISPATCHED, order_status.RECEIVED, order_status.CANCELLED]
+        barrier = threading.Barrier(self.writers)
+        results = [None] * self.writers
+
+        def writer(index):
+            try:
+                stale = Product.objects.get(pk=product.pk)
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        results[index] = order_status.transition_product(stale, targets[index % len(targets)])
+                        break
+                    except OperationalError:  # SQLite: another writer holds the table lock
+                        time.sleep(0.01)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(results.count(False), self.writers - 1)
+        winner = targets[results.index(True) % len(targets)]
+        self.assertEqual(Product.objects.get(pk=product.pk).order_status, winner)
+
+
+class BulkAssignTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name="Toshkent shahri")
+        cls.covered, cls.other = [City.objects.create(name=f"Tuman {i}", region=region) for i in range(2)]
+        cls.courier = Courier.objects.create(user=User.objects.create_user(
+            'courier', 'password', full_name="Courier", role='Courier'))
+        cls.courier.covered_cities.set([cls.covered])
+        cls.boss = User.objects.create_user('boss', 'password', full_name="Boss", role='Courier Boss')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.boss)
+
+    def product(self, order_number, city):
+        return Product.objects.create(
+            order_number=order_number, weight=1, address="Street", phone_number="1", city=city).pk
+
+    def assign(self, **payload):
+        return self.client.post('/api/accounts/assign-product/bulk/', {'courier': self.courier.pk, **payload},
+                                format='json')
+
+    def test_assigns_ids_with_one_update(self):
+        ids = [self.product(f"A{i}", self.covered) for i in range(50)] + [self.product("A-none", None)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.assign(product_ids=ids)
+        self.assertEqual(response.json(), {'updated': 51, 'skipped': []})
+        self.assertEqual(sum('UPDATE "accounts_product"' in query['sql'] for query in queries), 1)
+        self.assertEqual(Product.objects.filter(assigned_to=self.courier).count(), 51)
+
+    def test_rejects_uncovered_and_unknown_ids(self):
+        covered, uncovered = self.product("B1", self.covered), self.product("B2", self.other)
+        response = self.assign(product_ids=[covered, uncovered])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_ids'], [uncovered])
+        response = self.assign(product_ids=[covered, 999999])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exclude(assigned_to=None).exists())
+
+    def test_assigns_by_filter(self):
+        self.product("C1", self.covered)
+        self.product("C2", self.other)
+        response = self.assign(filter={'assigned': 'unassigned'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['cities'], [self.other.pk])
+
+        response = self.assign(filter={'city': self.covered.pk, 'assigned': 'unassigned'})
+        self.assertEqual(response.json(), {'updated': 1, 'skipped': []})
+        self.assertEqual(Product.objects.get(order_number="C1").assigned_to, self.courier)
+
+    def test_closed_products_are_not_reassigned(self):
+        other_courier = Courier.objects.create(user=User.objects.create_user(
+            'other', 'password', full_name="Other", role='Courier'))
+        open_id = self.product("D1", self.covered)
+        delivered_id, cancelled_id, uncovered_id = (
+            self.product("D2", self.covered), self.product("D3", self.covered), self.product("D4", self.other))
+        Product.objects.filter(pk=delivered_id).update(
+            order_status=order_status.DELIVERED, assigned_to=other_courier)
+        Product.objects.filter(pk__in=[cancelled_id, uncovered_id]).update(order_status=order_status.CANCELLED)
+
+        response = self.assign(product_ids=[open_id, delivered_id, cancelled_id, uncovered_id])
+        self.assertEqual(response.json(), {'updated': 1, 'skipped': [delivered_id, cancelled_id, uncovered_id]})
+        response = self.assign(filter={'city': self.covered.pk})
+        self.assertEqual(response.json(), {'updated': 0, 'skipped': []})
+        self.assertEqual(list(Product.objects.filter(assigned_to=self.courier).values_list('pk', flat=True)), [open_id])
+        self.assertEqual(Product.objects.get(pk=delivered_id).assigned_to, other_courier)
+
+    def test_validation(self):
+        for payload in ({}, {'product_ids': [1], 'filter': {'city': 1}}, {'filter': {}}, {'product_ids': []}):
+            with self.subTest(payload):
+                self.assertEqual(self.assign(**payload).status_code, 400)
+        self.client.force_authenticate(self.courier.user)
+        self.assertEqual(self.assign(filter={'city': self.covered.pk}).status_code, 403)
+
+
+class PlanAssignmentTests(SimpleTestCase):
+    def test_balances_open_workload_and_weight(self):
+        coverage = {1: [10, 11], 2: [11, 12]}
+        loads = {10: (3, 0.0), 11: (0, 0.0)}
+        candidates = [(100, 1, 20.0), (101, 1, 1.0), (102, 1, 1.0), (103, 2, 1.0), (104, 2, 1.0), (105, 3, 1.0)]
+        plan, uncovered = plan_assignment(candidates, coverage, loads, weight_unit=5)
+        # The 20 kg parcel counts as five parcels, so courier 11 gets it and the other
+        # city-1 parcels go to courier 10, whose three open parcels weigh less.
+        self.assertEqual(plan, {11: [100], 10: [101, 102], 12: [103, 104]})
+        self.assertEqual(uncovered, [105])
+
+
+class AutoAssignTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name="Toshkent shahri")
+        cls.cities = [City.objects.create(name=f"Tuman {i}", region=region) for i in range(3)]
+        cls.couriers = []
+        for i, covered in enumerate([cls.cities[:1], cls.cities[:2], cls.cities[1:2]]):
+            courier = Courier.objects.create(user=User.objects.create_user(
+                f'courier{i}', 'password', full_name=f"Courier {i}", role='Courier'))
+            courier.covered_cities.set(covered)
+            cls.couriers.append(courier)
+        cls.boss = User.objects.create_user('boss', 'password', full_name="Boss", role='Courier Boss')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.boss)
+
+    def products(self, prefix, count, city, **kwargs):
+        Product.objects.bulk_create([
+            Product(order_number=f"{prefix}{i}", weight=1, address="Street", phone_number="1", city=city, **kwargs)
+            for i in range(count)
+        ])
+
+    def test_assigns_evenly_with_one_update_per_courier(self):
+        self.products("L", 4, self.cities[0], assigned_to=self.couriers[0])
+        self.products("D", 5, self.cities[0], assigned_to=self.couriers[1], order_status='Delivered')
+        self.products("A", 10, self.cities[0])
+        self.products("B", 6, self.cities[1])
+        self.products("X", 2, self.cities[2])
+        self.products("C", 2, self.cities[0], order_status='Cancelled')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/accounts/assign-product/auto/', {}, format='json')
+        self.assertEqual(response.json(), {'assigned': 16, 'uncovered': 2, 'couriers': 3})
+        self.assertEqual(sum('UPDATE "accounts_product"' in query['sql'] for query in queries), 3)
+
+        open_parcels = dict(Product.objects.filter(order_status__in=order_status.OPEN_STATUSES).exclude(
+            assigned_to=None).order_by().values('assigned_to').annotate(n=Count('id')).values_list('assigned_to', 'n'))
+        self.assertEqual(open_parcels, {self.couriers[0].pk: 7, self.couriers[1].pk: 7, self.couriers[2].pk: 6})
+        self.assertFalse(Product.objects.filter(order_status='Cancelled').exclude(assigned_to=None).exists())
+
+    def test_filter_and_dry_run(self):
+        self.products("A", 3, self.cities[0])
+        self.products("B", 3, self.cities[1])
+        response = self.client.post('/api/accounts/assign-product/auto/', {'dry_run': True}, format='json')
+        self.assertEqual(response.json()['assigned'], 6)
+        self.assertFalse(Product.objects.exclude(assigned_to=None).exists())
+
+        response = self.client.post(
+            '/api/accounts/assign-product/auto/', {'filter': {'city': self.cities[1].pk}}, format='json')
+        self.assertEqual(response.json()['assigned'], 3)
+        self.assertEqual(set(Product.objects.exclude(assigned_to=None).values_list('city', flat=True)),
+                         {self.cities[1].pk})
+
+    def test_command(self):
+        self.products("A", 3, self.cities[0])
+        out = io.StringIO()
+        call_command('auto_assign_products', city=self.cities[0].pk, stdout=out)
+        self.assertIn("Assigned 3 product(s)", out.getvalue())
+        self.assertFalse(Product.objects.filter(assigned_to=None).exists())
+
+
+class RouteOptimizationTests(SimpleTestCase):
+    def test_haversine(self):
+        self.assertAlmostEqual(float(routing.haversine(41.0, 69.0, 42.0, 69.0)), 111.195, places=2)
+        matrix = routing.haversine_matrix([41.0, 42.0, 41.0], [69.0, 69.0, 70.0])
+        self.assertEqual(matrix.shape, (3, 3))
+        self.assertAlmostEqual(matrix[0, 1], matrix[1, 0])
+        self.assertEqual(matrix[2, 2], 0)
+
+    def test_orders_points_along_a_road(self):
+        longitudes = [69.0 + 0.01 * i for i in (5, 2, 8, 0, 3, 9, 1, 7, 4, 6)]
+        order, kilometres = routing.optimize_route([41.3] * 10, longitudes, start=(41.3, 68.99))
+        self.assertEqual([longitudes[i] for i in order], sorted(longitudes))
+        self.assertAlmostEqual(kilometres, float(routing.haversine(41.3, 68.99, 41.3, 69.09)), places=6)
+
+        # Without a start the route may begin at either end.
+        order, _ = routing.optimize_route([41.3] * 10, longitudes)
+        self.assertIn([longitudes[i] for i in order], [sorted(longitudes), sorted(longitudes, reverse=True)])
+
+    def test_large_route_is_fast(self):
+        rng = random.Random(0)
+        latitudes = [41.2 + rng.random() * 0.2 for _ in range(250)]
+        longitudes = [69.1 + rng.random() * 0.3 for _ in range(250)]
+        started = time.perf_counter()
+        order, kilometres = routing.optimize_route(latitudes, longitudes, start=(41.3, 69.25))
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(sorted(order), list(range(250)))
+
+        distances = routing.haversine_matrix([41.3, *latitudes], [69.25, *longitudes])
+        greedy = routing.nearest_neighbour_route(distances, 0)
+        self.assertLess(kilometres, distances[greedy[:-1], greedy[1:]].sum())
+
+
+class CourierRouteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = Courier.objects.create(user=User.objects.create_user(
+            'courier', 'password', full_name="Courier", role='Courier'))
+        cls.products = [
+            Product.objects.create(
+                order_number=f"P{i}", weight=1, address=f"Street {i}", phone_number="1", assigned_to=cls.courier,
+                latitude=41.3, longitude=69.0 + 0.01 * position)
+            for i, position in enumerate([3, 1, 2])
+        ]
+        cls.unlocated = Product.objects.create(
+            order_number="P-none", weight=1, address="Street", phone_number="1", assigned_to=cls.courier)
+        Product.objects.create(
+            order_number="P-done", weight=1, address="Street", phone_number="1", assigned_to=cls.courier,
+            latitude=41.0, longitude=70.0, order_status='Delivered')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier.user)
+
+    def test_route(self):
+        response = self.client.get('/api/accounts/courier/route/', {'lat': 41.3, 'lng': 69.0})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([stop['order_number'] for stop in data['stops']], ['P1', 'P2', 'P0'])
+        self.assertEqual(data['unrouted'], [self.unlocated.pk])
+        self.assertAlmostEqual(data['distance_km'], sum(stop['leg_km'] for stop in data['stops']), places=2)
+
+        # Served from the cache after one aggregate query, or 304 with the ETag.
+        with self.assertNumQueries(2):  # courier lookup + validators
+            self.assertEqual(self.client.get('/api/accounts/courier/route/', {'lat': 41.3, 'lng': 69.0}).json(), data)
+        response = self.client.get(
+            '/api/accounts/courier/route/', {'lat': 41.3, 'lng': 69.0}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_route_changes_with_product_set(self):
+        before = self.client.get('/api/accounts/courier/route/').json()
+        self.assertEqual(len(before['stops']), 3)
+        order_status.transition_product(self.products[1], order_status.RECEIVED)
+        order_status.transition_product(self.products[1], order_status.DELIVERED)
+        after = self.client.get('/api/accounts/courier/route/').json()
+        self.assertIn([stop['order_number'] for stop in after['stops']], [['P2', 'P0'], ['P0', 'P2']])
+
+    def test_boss_and_validation(self):
+        boss = User.objects.create_user('boss', 'password', full_name="Boss", role='Courier Boss')
+        self.assertEqual(self.client.get('/api/accounts/courier/route/', {'lat': 41.3}).status_code, 400)
+        self.client.force_authenticate(boss)
+        response = self.client.get(f'/api/accounts/couriers/{self.courier.pk}/route/')
+        self.assertEqual(len(response.json()['stops']), 3)
+        self.assertEqual(self.client.get('/api/accounts/courier/route/').status_code, 403)
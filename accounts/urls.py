@@ -5,7 +5,9 @@ from .views import (
     CourierViewSet, ProductViewSet, RegionViewSet,
     CityViewSet, AssignProductView, FileUploadView,
     CourierCreateAPIView, MyTokenObtainPairView, CourierProductListView,
-    ConfirmReceiptProductView, ConfirmDeliveredProductView
+    ConfirmReceiptProductView, ConfirmDeliveredProductView, ImportJobDetailView,
+    CourierProductChangesView, BulkConfirmReceiptView, BulkConfirmDeliveredView,
+    BulkAssignProductView, AutoAssignProductView, CourierRouteView,
 )
 
 router = DefaultRouter()
@@ -17,12 +19,19 @@ router.register(r'regions', RegionViewSet)
 urlpatterns = [
     path('couriers/create/', CourierCreateAPIView.as_view(), name='courier-create'),
     path('courier/products/', CourierProductListView.as_view(), name='courier-products'),
+    path('courier/products/changes/', CourierProductChangesView.as_view(), name='courier-product-changes'),
+    path('courier/route/', CourierRouteView.as_view(), name='courier-route'),
     path('confirm-receipt/', ConfirmReceiptProductView.as_view(), name='confirm-receipt'),
     path('confirm-delivered/', ConfirmDeliveredProductView.as_view(), name='confirm-delivered'),
+    path('confirm-receipt/bulk/', BulkConfirmReceiptView.as_view(), name='confirm-receipt-bulk'),
+    path('confirm-delivered/bulk/', BulkConfirmDeliveredView.as_view(), name='confirm-delivered-bulk'),
     path('', include(router.urls)),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('assign-product/', AssignProductView.as_view(), name='assign-product'),
+    path('assign-product/bulk/', BulkAssignProductView.as_view(), name='assign-product-bulk'),
+    path('assign-product/auto/', AutoAssignProductView.as_view(), name='assign-product-auto'),
     path('upload/', FileUploadView.as_view(), name='file-upload'),
+    path('imports/<int:pk>/', ImportJobDetailView.as_view(), name='import-job-detail'),
 ]
@@ -1,12 +1,51 @@
 import openpyxl
+import csv
 import datetime
 import decimal
-from rapidfuzz import fuzz
-from .models import City, Region, Product
+import hashlib
+import io
+import itertools
+import json
+import uuid
+import numpy
+import pandas
+from django.db import transaction, DatabaseError
+from rapidfuzz import fuzz, process
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import City, Region, Product, ImportJournal
 from .sms import transmit_sms
 
+# Manifest columns, in order (see import_products_from_excel). NDJSON objects use these keys.
+MANIFEST_FIELDS = [
+    'serial_number',
+    'order_status',
+    'date',
+    'order_number',
+    'weight',
+    'name',
+    'name_cn',
+    'address',
+    'city',
+    'region',
+    'phone_number',
+]
+MANIFEST_COLUMNS = len(MANIFEST_FIELDS)
 
-def get_or_create_normalized_city(city_name, region_obj=None, threshold=80):
+# Minimum rapidfuzz token_sort_ratio score for an imported city name to match an existing City.
+CITY_MATCH_THRESHOLD = 80
+
+# Product fields written by an import; upserts compare and update exactly these.
+UPSERT_FIELDS = ['date', 'weight', 'address', 'city', 'region', 'phone_number']
+# Precision of Product.weight, used to compare imported weights with stored ones.
+WEIGHT_QUANTUM = decimal.Decimal('0.01')
+
+# Number of rows normalized and written per transaction during import.
+IMPORT_CHUNK_SIZE = 1000
+
+
+def get_or_create_normalized_city(city_name, region_obj=None, threshold=CITY_MATCH_THRESHOLD):
     """
     Uses fuzzy matching to find a City instance that closely matches the provided city_name.
     If a match with a similarity score >= threshold is found, returns that City.
@@ -17,25 +56,127 @@ def get_or_create_normalized_city(city_name, region_obj=None, threshold=80):
     normalized_input = city_name.strip().lower()
 
     if region_obj:
-        cities = City.objects.filter(region=region_obj)
+        cities = list(City.objects.filter(region=region_obj).order_by('pk'))
     else:
-        cities = City.objects.all()
+        cities = list(City.objects.order_by('pk'))
 
-    best_match = None
-    highest_score = 0
+    match = process.extractOne(
+        normalized_input,
+        [city.name.lower() for city in cities],
+        scorer=fuzz.token_sort_ratio,
+        score_cutoff=threshold,
+    )
+    if match is not None:
+        return cities[match[2]]
+    if region_obj is None:
+        raise ValueError("Region object must be provided to create a new City.")
+    return City.objects.create(name=city_name.strip(), region=region_obj)
 
-    for city in cities:
-        score = fuzz.token_sort_ratio(normalized_input, city.name.lower())
-        if score > highest_score:
-            highest_score = score
-            best_match = city
 
-    if highest_score >= threshold:
-        return best_match
-    else:
-        if region_obj is None:
-            raise ValueError("Region object must be provided to create a new City.")
-        return City.objects.create(name=city_name.strip(), region=region_obj)
+class CityMatcher:
+    """
+    In-memory fuzzy index of City names used during imports.
+
+    Each region's cities are loaded once with their lowercased names, cache misses are matched
+    in batches with rapidfuzz's cdist, and results are cached per (region, name). Cities created
+    for unmatched names are added to the index, so the matcher gives the same answers as calling
+    get_or_create_normalized_city row by row without querying the database for every row.
+    """
+
+    def __init__(self, threshold=CITY_MATCH_THRESHOLD):
+        self.threshold = threshold
+        # region pk -> ([lowercased city names], [City objects]), both in pk order
+        self._index = {}
+        # (region pk, normalized name) -> (City, score, index size when scored)
+        self._cache = {}
+
+    def _region_index(self, region_obj):
+        index = self._index.get(region_obj.pk)
+        if index is None:
+            cities = list(City.objects.filter(region=region_obj).order_by('pk'))
+            index = ([city.name.lower() for city in cities], cities)
+            self._index[region_obj.pk] = index
+        return index
+
+    def _best_since(self, query, index, start):
+        """
+        Best (City, score) among the cities added to index at position start or later.
+        """
+        names, cities = index
+        if start >= len(names):
+            return None, -1
+        match = process.extractOne(query, names[start:], scorer=fuzz.token_sort_ratio)
+        return cities[start + match[2]], match[1]
+
+    def _lookup_cached(self, key, query, index):
+        city, score, size = self._cache[key]
+        # A city created after this entry was scored may be a closer match.
+        if score < 100 and len(index[0]) > size:
+            newer_city, newer_score = self._best_since(query, index, size)
+            if newer_score > score:
+                city, score = newer_city, newer_score
+            self._cache[key] = (city, score, len(index[0]))
+        return city
+
+    def match(self, city_name, region_obj):
+        """
+        Returns the City matching city_name in region_obj, creating it if nothing is close enough.
+        """
+        return self.match_many([(city_name, region_obj)])[0]
+
+    def match_many(self, pairs):
+        """
+        Resolves a list of (city_name, region_obj) pairs, in order, to a list of City objects.
+        """
+        regions = {}
+        misses = {}
+        for city_name, region_obj in pairs:
+            key = (region_obj.pk, city_name.strip().lower())
+            if key not in self._cache:
+                regions[region_obj.pk] = region_obj
+                region_misses = misses.setdefault(region_obj.pk, {})
+                if key not in region_misses:
+                    region_misses[key] = len(region_misses)
+
+        # Score every uncached name against its region's index with one cdist call per region.
+        snapshots = {}
+        for region_pk, keys in misses.items():
+            names = self._region_index(regions[region_pk])[0]
+            scores = None
+            if names:
+                scores = process.cdist([key[1] for key in keys], names,
+                                       scorer=fuzz.token_sort_ratio, dtype=numpy.float64)
+            snapshots[region_pk] = (len(names), scores, keys)
+
+        results = []
+        for city_name, region_obj in pairs:
+            query = city_name.strip().lower()
+            key = (region_obj.pk, query)
+            index = self._region_index(region_obj)
+            if key in self._cache:
+                results.append(self._lookup_cached(key, query, index))
+                continue
+
+            names, cities = index
+            base_size, scores, keys = snapshots[region_obj.pk]
+            city, score = None, -1
+            if scores is not None:
+                row = scores[keys[key]]
+                position = row.argmax()
+                city, score = cities[position], row[position]
+            # Cities created earlier in this batch were not part of the cdist snapshot.
+            new_city, new_score = self._best_since(query, index, base_size)
+            if new_score > score:
+                city, score = new_city, new_score
+
+            if score < self.threshold:
+                city = City.objects.create(name=city_name.strip(), region=region_obj)
+                names.append(city.name.lower())
+                cities.append(city)
+                score = 100
+            self._cache[key] = (city, float(score), len(names))
+            results.append(city)
+        return results
 
 
 def format_text(text):
@@ -73,10 +214,527 @@ def format_text(text):
     return " ".join(formatted_words)
 
 
-def import_products_from_excel(excel_file):
+class ImportRowError(Exception):
+    """
+    Raised when a manifest row cannot be turned into a Product.
+    The message is reported back to the uploader as-is.
+    """
+
+
+def iter_excel_rows(excel_file):
+    """
+    Streams the data rows (row 2 onwards) of the active sheet as tuples of values.
+
+    The workbook is opened in read_only mode so cells are parsed lazily and memory use
+    stays constant regardless of file size.
+    """
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def iter_csv_rows(csv_file):
+    """
+    Streams the data rows (after the header line) of a UTF-8 CSV manifest.
+    Empty fields are returned as None, like empty cells in a workbook.
+    """
+    text = io.TextIOWrapper(csv_file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        next(reader, None)
+        for row in reader:
+            yield tuple(value if value != '' else None for value in row)
+    finally:
+        # Leave the underlying upload open for the caller.
+        text.detach()
+
+
+def iter_ndjson_rows(ndjson_file):
+    """
+    Streams rows from a newline-delimited JSON manifest. Each line is either an array of
+    column values or an object keyed by MANIFEST_FIELDS; there is no header line.
+    """
+    for line in ndjson_file:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            yield tuple(record.get(field) for field in MANIFEST_FIELDS)
+        else:
+            yield tuple(record)
+
+
+def iter_parquet_rows(parquet_file):
+    """
+    Streams rows from a Parquet manifest, one record batch at a time. Columns are taken by
+    position; the schema's column names are not used.
+    """
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet import requires the pyarrow package.")
+    for batch in pyarrow.parquet.ParquetFile(parquet_file).iter_batches(batch_size=IMPORT_CHUNK_SIZE):
+        columns = [column.to_pylist() for column in batch.columns]
+        yield from zip(*columns)
+
+
+def file_sha256(upload):
+    """
+    SHA-256 hex digest of an uploaded file's contents. Leaves the file at the start.
+    """
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for block in iter(lambda: upload.read(1024 * 1024), b''):
+        digest.update(block)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def sniff_manifest_format(upload):
     """
-    Import products from an Excel file using openpyxl.
-    Assumes data starts from row 2 with the following fixed column indices:
+    Detects the format of an uploaded manifest from its first bytes:
+    'xlsx', 'parquet', 'ndjson' or 'csv'.
+    """
+    upload.seek(0)
+    head = upload.read(512)
+    upload.seek(0)
+    if head.startswith(b'PK\x03\x04'):
+        return 'xlsx'
+    if head.startswith(b'PAR1'):
+        return 'parquet'
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        raise ValueError("Legacy .xls files are not supported; save the file as .xlsx or CSV.")
+    if head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith((b'{', b'[')):
+        return 'ndjson'
+    return 'csv'
+
+
+MANIFEST_READERS = {
+    'xlsx': iter_excel_rows,
+    'csv': iter_csv_rows,
+    'ndjson': iter_ndjson_rows,
+    'parquet': iter_parquet_rows,
+}
+
+
+def iter_manifest_rows(upload):
+    """
+    Streams the data rows of a manifest in any supported format (see sniff_manifest_format).
+    Every format yields the same positional columns, documented in import_products_from_excel.
+    """
+    return MANIFEST_READERS[sniff_manifest_format(upload)](upload)
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most `size` items from iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def normalize_product_row(row):
+    """
+    Converts one raw manifest row into a dict of Product field values
+    (order_number, date, weight, address, city_name, region_name, phone_number).
+
+    Raises ImportRowError if the row cannot be imported.
+    """
+    # read_only worksheets without dimension info may yield short rows; pad them the same
+    # way a fully loaded worksheet would.
+    if len(row) < MANIFEST_COLUMNS:
+        row = tuple(row) + (None,) * (MANIFEST_COLUMNS - len(row))
+
+    date_str = row[2]
+    order_number = row[3]
+    weight_raw = row[4]
+    address = row[7]
+    city_field = row[8]
+    region_field = row[9]
+    phone = row[10]
+
+    if order_number is not None:
+        order_number = str(order_number)
+
+    try:
+        # Convert weight:
+        if weight_raw is not None:
+            if isinstance(weight_raw, str):
+                weight_str = weight_raw.replace(',', '.')
+            else:
+                weight_str = str(weight_raw)
+        else:
+            weight_str = "0"
+        weight = decimal.Decimal(weight_str)
+        if not weight.is_finite():
+            raise ValueError(f"invalid weight {weight_str}")
+    except Exception as e:
+        raise ImportRowError(f"Error processing row for order {order_number}: {e}")
+
+    try:
+        date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
+    except Exception as e:
+        raise ImportRowError(f"Error parsing date {date_str} for order {order_number}: {e}")
+
+    # Process city: if '/' is present, take the part after the slash; otherwise, use the full string.
+    if city_field and isinstance(city_field, str):
+        if '/' in city_field:
+            raw_city = city_field.split('/', 1)[1].strip()
+        else:
+            raw_city = city_field.strip()
+        city_name = format_text(raw_city)
+    else:
+        city_name = ""
+
+    # Process region similarly:
+    if region_field and isinstance(region_field, str):
+        if '/' in region_field:
+            raw_region = region_field.split('/', 1)[1].strip()
+        else:
+            raw_region = region_field.strip()
+        region_name = format_text(raw_region)
+    else:
+        region_name = ""
+
+    # Convert phone to string and ensure it starts with '+998'
+    if phone is not None:
+        phone = str(phone).strip()
+        if not phone.startswith('+998'):
+            phone = '+998' + phone
+
+    return {
+        'order_number': order_number,
+        'date': date_obj.date(),
+        'weight': weight,
+        'address': address,
+        'city_name': city_name,
+        'region_name': region_name,
+        'phone_number': phone,
+    }
+
+
+def _bulk_insert_products(products, messages):
+    """
+    Inserts products with a single bulk_create. If the batch is rejected by the database,
+    falls back to saving row by row so one bad row does not drop the whole chunk.
+    Returns the number of products inserted.
+    """
+    try:
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+        return len(products)
+    except DatabaseError:
+        pass
+
+    inserted = 0
+    for product in products:
+        try:
+            with transaction.atomic():
+                product.save()
+            inserted += 1
+        except DatabaseError as e:
+            messages.append(f"Error processing row for order {product.order_number}: {e}")
+    return inserted
+
+
+def _bulk_update_products(products, messages):
+    """
+    Writes the UPSERT_FIELDS of products with a single bulk_update, falling back to
+    row-by-row saves if the batch is rejected. Returns the number of products updated.
+    """
+    try:
+        with transaction.atomic():
+            Product.objects.bulk_update(products, UPSERT_FIELDS)
+        return len(products)
+    except DatabaseError:
+        pass
+
+    updated = 0
+    for product in products:
+        try:
+            with transaction.atomic():
+                product.save(update_fields=UPSERT_FIELDS)
+            updated += 1
+        except DatabaseError as e:
+            messages.append(f"Error processing row for order {product.order_number}: {e}")
+    return updated
+
+
+def _resolve_places(rows, positions, region_cache, city_matcher):
+    """
+    Gets or creates the Region of every row at positions, then matches all their cities in
+    one batch. Returns a dict mapping row position to City.
+    """
+    for position in positions:
+        region_name = rows[position]['region_name']
+        if region_name and region_name not in region_cache:
+            region_cache[region_name], _ = Region.objects.get_or_create(name=region_name)
+    city_positions = [
+        position for position in positions
+        if rows[position]['city_name'] and rows[position]['region_name']
+    ]
+    return dict(zip(city_positions, city_matcher.match_many(
+        [(rows[position]['city_name'], region_cache[rows[position]['region_name']])
+         for position in city_positions]
+    )))
+
+
+def _product_values(data, city, region_cache):
+    return {
+        'date': data['date'],
+        'weight': data['weight'],
+        'address': data['address'],
+        'city': city,
+        'region': region_cache.get(data['region_name']),
+        'phone_number': data['phone_number'],
+    }
+
+
+def _product_differs(product, values):
+    """
+    True if saving values would change product. Weights are compared at the precision
+    the column stores.
+    """
+    for field, value in values.items():
+        if field in ('city', 'region'):
+            if getattr(product, f'{field}_id') != (value.pk if value else None):
+                return True
+        elif field == 'weight':
+            if value.quantize(WEIGHT_QUANTUM) != product.weight:
+                return True
+        elif getattr(product, field) != value:
+            return True
+    return False
+
+
+def write_product_chunk(rows, messages, region_cache, city_matcher, upsert=False):
+    """
+    Writes one chunk of normalized rows (dicts from normalize_product_row, or ImportRowError
+    instances for rows that failed to normalize) inside a single transaction.
+
+    Order numbers that already exist, in the database or earlier in the chunk, are found with
+    one IN query. By default they are reported and skipped without resolving their region
+    and city. With upsert=True the existing products are loaded in that query instead, and
+    those whose fields differ from the row are written back with one bulk_update; when an
+    order number repeats, the last row wins.
+
+    region_cache maps region names to Region objects and city_matcher is a CityMatcher;
+    both are shared between chunks. Messages are appended in row order.
+    Returns a tuple (inserted, updated, unchanged) of product counts.
+    """
+    order_numbers = [data['order_number'] for data in rows if not isinstance(data, ImportRowError)]
+
+    with transaction.atomic():
+        if upsert:
+            return _upsert_product_chunk(rows, order_numbers, messages, region_cache, city_matcher)
+
+        known_order_numbers = set(Product.objects.filter(
+            order_number__in=order_numbers
+        ).values_list('order_number', flat=True))
+        fresh_positions = []
+        for position, data in enumerate(rows):
+            if isinstance(data, ImportRowError) or data['order_number'] in known_order_numbers:
+                continue
+            known_order_numbers.add(data['order_number'])
+            fresh_positions.append(position)
+
+        cities = _resolve_places(rows, fresh_positions, region_cache, city_matcher)
+
+        new_products = []
+        fresh_positions = set(fresh_positions)
+        for position, data in enumerate(rows):
+            if isinstance(data, ImportRowError):
+                messages.append(str(data))
+                continue
+
+            order_number = data['order_number']
+            if position not in fresh_positions:
+                messages.append(f"Product {order_number} already exists.")
+                continue
+            new_products.append(Product(
+                order_number=order_number,
+                **_product_values(data, cities.get(position), region_cache),
+            ))
+
+        return _bulk_insert_products(new_products, messages), 0, 0
+
+
+def _upsert_product_chunk(rows, order_numbers, messages, region_cache, city_matcher):
+    existing = {
+        product.order_number: product
+        for product in Product.objects.filter(order_number__in=order_numbers).only('order_number', *UPSERT_FIELDS)
+    }
+    valid_positions = [position for position, data in enumerate(rows) if not isinstance(data, ImportRowError)]
+    cities = _resolve_places(rows, valid_positions, region_cache, city_matcher)
+
+    new_products = {}
+    changed = {}
+    for position, data in enumerate(rows):
+        if isinstance(data, ImportRowError):
+            messages.append(str(data))
+            continue
+
+        order_number = data['order_number']
+        values = _product_values(data, cities.get(position), region_cache)
+        product = existing.get(order_number) or new_products.get(order_number)
+        if product is None:
+            new_products[order_number] = Product(order_number=order_number, **values)
+        elif order_number in new_products:
+            for field, value in values.items():
+                setattr(new_products[order_number], field, value)
+        elif _product_differs(product, values):
+            for field, value in values.items():
+                setattr(product, field, value)
+            changed[order_number] = product
+
+    inserted = _bulk_insert_products(list(new_products.values()), messages)
+    updated = _bulk_update_products(list(changed.values()), messages)
+    return inserted, updated, len(existing) - len(changed)
+
+
+def normalize_rows(rows):
+    """
+    Normalizes raw rows, keeping failed rows in place as ImportRowError instances.
+    """
+    normalized = []
+    for row in rows:
+        try:
+            normalized.append(normalize_product_row(row))
+        except ImportRowError as e:
+            normalized.append(e)
+    return normalized
+
+
+def _place_names(column):
+    """
+    City/region handling for a whole column: the part after the first '/' (or the whole
+    value), stripped and passed through format_text once per distinct value.
+    """
+    names = {}
+    for value in column.unique():
+        if isinstance(value, str) and value:
+            names[value] = format_text((value.split('/', 1)[1] if '/' in value else value).strip())
+        else:
+            names[value] = ""
+    return column.map(names)
+
+
+def normalize_rows_vectorized(rows):
+    """
+    pandas equivalent of normalize_rows: loads the rows into a DataFrame and applies the
+    column transforms of normalize_product_row to whole columns at once. Values that have to
+    go through Decimal or format_text are converted once per distinct value.
+
+    The result is identical to normalize_rows(rows).
+    """
+    if not rows:
+        return []
+    padded = [
+        tuple(row) + (None,) * (MANIFEST_COLUMNS - len(row)) if len(row) < MANIFEST_COLUMNS else row
+        for row in rows
+    ]
+    frame = pandas.DataFrame(padded, dtype=object).iloc[:, :MANIFEST_COLUMNS]
+
+    # Only None counts as an empty cell, as in normalize_product_row; float NaN (e.g. from
+    # pandas or Parquet) is converted like any other value.
+    missing = frame[[3, 4, 10]].map(lambda value: value is None)
+    is_str = frame[[2, 4]].map(lambda value: isinstance(value, str))
+
+    order_numbers = frame[3].astype(str).where(~missing[3], None)
+
+    # Weight: comma decimal separator for strings, str() for numbers, "0" when empty.
+    weight_str = frame[4].astype(str)
+    weight_str = weight_str.where(~is_str[4], frame[4].where(is_str[4], '').str.replace(',', '.', regex=False))
+    weight_str = weight_str.where(~missing[4], '0')
+    weights = {}
+    for value in weight_str.unique():
+        try:
+            weights[value] = decimal.Decimal(value)
+            if not weights[value].is_finite():
+                raise ValueError(f"invalid weight {value}")
+        except Exception as e:
+            weights[value] = e
+    weight_values = weight_str.map(weights)
+
+    dates = pandas.to_datetime(frame[2].where(is_str[2]), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    date_values = [None if pandas.isna(value) else value.date() for value in dates]
+
+    city_names = _place_names(frame[8])
+    region_names = _place_names(frame[9])
+
+    phones = frame[10].astype(str).str.strip()
+    phones = phones.where(phones.str.startswith('+998'), '+998' + phones).where(~missing[10], None)
+
+    normalized = []
+    for order_number, weight, date_value, date_raw, address, city_name, region_name, phone in zip(
+            order_numbers.tolist(), weight_values.tolist(), date_values, frame[2].tolist(),
+            frame[7].tolist(), city_names.tolist(), region_names.tolist(), phones.tolist()):
+        if isinstance(weight, Exception):
+            normalized.append(ImportRowError(f"Error processing row for order {order_number}: {weight}"))
+            continue
+        if date_value is None:
+            # Unparsable for pandas; strptime gives the definitive answer and the error text.
+            try:
+                date_value = datetime.datetime.strptime(date_raw, '%Y-%m-%d %H:%M:%S').date()
+            except Exception as e:
+                normalized.append(ImportRowError(f"Error parsing date {date_raw} for order {order_number}: {e}"))
+                continue
+        normalized.append({
+            'order_number': order_number,
+            'date': date_value,
+            'weight': weight,
+            'address': address,
+            'city_name': city_name,
+            'region_name': region_name,
+            'phone_number': phone,
+        })
+    return normalized
+
+
+def claim_import_journal(file_hash, upsert):
+    """
+    Claims the ImportJournal of a file for the calling import and returns (journal, token).
+    A journal whose import completed is reset, so the file is imported again from the start.
+
+    The claim is a conditional UPDATE, so of two imports of the same file (e.g. a double
+    submitted upload) only one gets it; the other raises ValueError. A claim whose holder has
+    not checkpointed for IMPORT_CLAIM_TIMEOUT seconds is considered abandoned and taken over.
+    """
+    journal, _ = ImportJournal.objects.get_or_create(file_hash=file_hash, upsert=upsert)
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=getattr(settings, 'IMPORT_CLAIM_TIMEOUT', 600))
+    claimed = ImportJournal.objects.filter(
+        Q(claimed_by=None) | Q(updated_at__lt=stale), pk=journal.pk,
+    ).update(claimed_by=token, updated_at=now)
+    if not claimed:
+        raise ValueError("This file is already being imported by another job.")
+    journal.refresh_from_db()
+    if journal.completed:
+        ImportJournal.objects.filter(pk=journal.pk).update(rows_committed=0, rows_imported=0, completed=False)
+        journal.refresh_from_db()
+    return journal, token
+
+
+def release_import_journal(journal, token):
+    ImportJournal.objects.filter(pk=journal.pk, claimed_by=token).update(claimed_by=None)
+
+
+def import_products_from_excel(excel_file, chunk_size=IMPORT_CHUNK_SIZE, progress=None, vectorized=False,
+                               resume=True, upsert=False):
+    """
+    Import products from a manifest file: Excel (.xlsx, read with openpyxl), CSV, NDJSON or
+    Parquet, detected from the file contents.
+    Excel and CSV data starts from row 2; every format uses the following fixed column indices:
       0: Serial number (ignored)
       1: Order status ("确认订单" => confirmed, else pending)
       2: Date (e.g., "2025-01-06 23:59:34")
@@ -89,95 +747,81 @@ def import_products_from_excel(excel_file):
       9: Region (if contains '/', use part after the slash then format it)
      10: Phone number
 
+    Rows are streamed from the workbook and written chunk_size rows at a time, each chunk
+    with one bulk_create in its own transaction, so memory use does not grow with the file.
+    If given, progress(rows_processed, rows_imported) is called after every chunk.
+    vectorized=True normalizes each chunk with pandas (normalize_rows_vectorized) instead of
+    row by row; the results are the same.
+
+    With resume=True, progress is checkpointed in an ImportJournal keyed by the file's hash:
+    submitting the same file again after an interrupted import skips the rows committed by
+    earlier attempts. A file whose import completed is imported again from the start. The
+    journal is claimed for the duration of the import (see claim_import_journal), so a second
+    import of the same file fails with ValueError while the first is running.
+    resume=False starts from scratch without a journal.
+
+    By default rows whose order number already exists are reported and skipped. With
+    upsert=True those products are updated from the row instead (see write_product_chunk),
+    and the summary message counts inserted, updated and unchanged products.
+
     Returns a list of messages describing the result.
     """
-    wb = openpyxl.load_workbook(excel_file)
-    ws = wb.active
     messages = []
-    imported_count = 0
+    processed_count = 0
 
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        try:
-            date_str = row[2]
-            order_number = row[3]
-            weight_raw = row[4]
-            address = row[7]
-            city_field = row[8]
-            region_field = row[9]
-            phone = row[10]
-
-            # Convert weight:
-            if weight_raw is not None:
-                if isinstance(weight_raw, str):
-                    weight_str = weight_raw.replace(',', '.')
-                else:
-                    weight_str = str(weight_raw)
-            else:
-                weight_str = "0"
-            weight = decimal.Decimal(weight_str)
+    journal = token = None
+    if resume:
+        journal, token = claim_import_journal(file_sha256(excel_file), upsert)
+        if journal.rows_committed:
+            processed_count = journal.rows_committed
+            messages.append(f"Resuming import after {journal.rows_committed} already processed rows.")
+    else:
+        ImportJournal.objects.filter(file_hash=file_sha256(excel_file), upsert=upsert).delete()
 
-            try:
-                date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-            except Exception as e:
-                messages.append(f"Error parsing date {date_str} for order {order_number}: {e}")
-                continue
+    try:
+        _import_rows(excel_file, chunk_size, progress, vectorized, upsert, journal, token, processed_count, messages)
+    finally:
+        if journal:
+            release_import_journal(journal, token)
+    return messages
 
-            # Process city: if '/' is present, take the part after the slash; otherwise, use the full string.
-            if city_field and isinstance(city_field, str):
-                if '/' in city_field:
-                    raw_city = city_field.split('/', 1)[1].strip()
-                else:
-                    raw_city = city_field.strip()
-                city_name = format_text(raw_city)
-            else:
-                city_name = ""
-
-            # Process region similarly:
-            if region_field and isinstance(region_field, str):
-                if '/' in region_field:
-                    raw_region = region_field.split('/', 1)[1].strip()
-                else:
-                    raw_region = region_field.strip()
-                region_name = format_text(raw_region)
-            else:
-                region_name = ""
-
-            # Convert phone to string and ensure it starts with '+998'
-            if phone is not None:
-                phone = str(phone).strip()
-                if not phone.startswith('+998'):
-                    phone = '+998' + phone
-
-            # Get or create Region:
-            region_obj = None
-            if region_name:
-                region_obj, _ = Region.objects.get_or_create(name=region_name)
-            # Get or create City using rapidfuzz-based normalization.
-            city_obj = None
-            if city_name and region_obj:
-                city_obj = get_or_create_normalized_city(city_name, region_obj=region_obj)
-            else:
-                city_obj = None
 
-            # Create or get the Product.
-            product, created = Product.objects.get_or_create(
-                order_number=order_number,
-                defaults={
-                    'date': date_obj,
-                    'weight': weight,
-                    'address': address,
-                    'city': city_obj,
-                    'region': region_obj,
-                    'phone_number': phone,
-                }
-            )
-            if created:
-                imported_count += 1
-            else:
-                messages.append(f"Product {order_number} already exists.")
-        except Exception as e:
-            messages.append(f"Error processing row for order {order_number}: {e}")
-            continue
+def _import_rows(excel_file, chunk_size, progress, vectorized, upsert, journal, token, processed_count, messages):
+    imported_count = 0
+    updated_count = 0
+    unchanged_count = 0
+    region_cache = {}
+    city_matcher = CityMatcher()
 
-    messages.append(f"Imported {imported_count} products successfully.")
-    return messages
+    rows = itertools.islice(iter_manifest_rows(excel_file), processed_count, None)
+    normalizer = normalize_rows_vectorized if vectorized else normalize_rows
+    for chunk in chunked(rows, chunk_size):
+        normalized = normalizer(chunk)
+        with transaction.atomic():
+            chunk_imported, chunk_updated, chunk_unchanged = write_product_chunk(
+                normalized, messages, region_cache, city_matcher, upsert=upsert)
+            if journal:
+                # Checkpoint in the same transaction as the chunk itself, and only while this
+                # import still holds the claim; otherwise the chunk is rolled back.
+                checkpointed = ImportJournal.objects.filter(pk=journal.pk, claimed_by=token).update(
+                    rows_committed=F('rows_committed') + len(normalized),
+                    rows_imported=F('rows_imported') + chunk_imported,
+                    updated_at=timezone.now(),
+                )
+                if not checkpointed:
+                    raise ValueError("Another job took over the import of this file.")
+        imported_count += chunk_imported
+        updated_count += chunk_updated
+        unchanged_count += chunk_unchanged
+        processed_count += len(normalized)
+        if progress:
+            progress(processed_count, imported_count)
+
+    if journal:
+        ImportJournal.objects.filter(pk=journal.pk, claimed_by=token).update(
+            completed=True, updated_at=timezone.now())
+    if upsert:
+        messages.append(f"Imported {imported_count} products, updated {updated_count}, "
+                        f"{unchanged_count} unchanged.")
+    else:
+        messages.append(f"Imported {imported_count} products successfully.")
@@ -1,14 +1,22 @@
 from rest_framework import status, generics, permissions, viewsets
 from rest_framework.views import APIView
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.parsers import FileUploadParser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.http import HttpResponse
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.db import transaction
+from django.db.models import Q
 
-from .models import Region, City, Product, Courier
+from .models import Region, City, Product, Courier, ImportJob, current_product_revision, next_product_revision
 from .serializers import (
     UserRegistrationSerializer,
     UserSerializer,
@@ -18,10 +26,27 @@ from .serializers import (
     RegionSerializer,
     CourierCreateSerializer,
     ProductImageSerializer,  # if needed for product images
-    MyTokenObtainPairSerializer
+    MyTokenObtainPairSerializer,
+    ImportJobSerializer,
+    product_list_values,
+    product_list_rows,
+    parse_product_fields,
+    ProductIdsSerializer,
+    BulkAssignSerializer,
+    AutoAssignSerializer,
+    RouteParamsSerializer,
 )
+from .assignment import auto_assign_products
+from .exports import export_products_response
+from .filter import ProductFilterBackend, ProductOrderingFilter, product_filter_lookups
+from .caching import etag_matches, get_cached_reference, product_list_etag
+from . import order_status
+from .pagination import ProductKeysetPagination, decode_cursor, encode_cursor
+from .renderers import ORJSONRenderer
+from .routing import courier_route
 from .permissions import IsAdminOrCourierBoss, IsAdmin, IsCourierBoss
-from .utils import get_or_create_normalized_city, import_products_from_excel, format_text
+from .utils import get_or_create_normalized_city, format_text
+from .jobs import submit_import_job
 
 User = get_user_model()
 
@@ -30,12 +55,15 @@ class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
 # ---------------------------
-# File Upload and Excel Import View
+# File Upload and Manifest Import View
 # ---------------------------
 class FileUploadView(APIView):
     """
-    Upload an Excel file to import Products.
-    Expected Excel columns (starting at row 2):
+    Upload a manifest file to import Products: Excel (.xlsx), CSV, NDJSON or Parquet.
+    The format is detected from the file contents. Every format uses the same columns;
+    Excel and CSV files start at row 2, NDJSON lines may also be objects keyed by
+    accounts.utils.MANIFEST_FIELDS.
+    Expected columns:
       0: Serial Number (ignored)
       1: Order Status ("确认订单" => confirmed, else pending)
       2: Creation Date (e.g., "2025-01-06 23:59:34")
@@ -47,6 +75,10 @@ class FileUploadView(APIView):
       8: City (if contains '/', use part after the slash and format it)
       9: Region (if contains '/', use part after the slash and format it)
      10: Phone Number
+
+    The import runs in the background; the response carries the id of an ImportJob
+    whose progress can be polled at imports/<id>/.
+    With ?mode=upsert, existing products are updated from the file instead of skipped.
     """
     parser_classes = (FileUploadParser,)
 
@@ -54,11 +86,27 @@ class FileUploadView(APIView):
         file_obj = request.data.get('file')
         if not file_obj:
             return Response({"error": "No file provided."}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            messages = import_products_from_excel(file_obj)
-            return Response({"messages": messages}, status=status.HTTP_201_CREATED)
-        except Exception as e:
-            return Response({"error": f"Error processing Excel file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        job = ImportJob.objects.create(
+            file=file_obj,
+            upsert=request.query_params.get('mode') == 'upsert',
+            created_by=request.user if request.user.is_authenticated else None,
+        )
+        submit_import_job(job)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobDetailView(generics.RetrieveAPIView):
+    """
+    Progress and result of a background product import, visible to the user who started it
+    and to admins. Session authentication is accepted so the admin import page can poll it.
+    """
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return self.queryset.visible_to(self.request.user)
 
 
 # ---------------------------
@@ -110,14 +158,63 @@ class LogoutView(APIView):
 # ---------------------------
 # ViewSets for City, Region, Courier, and Product
 # ---------------------------
-class CityViewSet(viewsets.ModelViewSet):
-    queryset = City.objects.all()
+class CachedListMixin:
+    """
+    Serves list() from the reference cache with an ETag, answering 304 Not Modified when
+    the client already has the current list. Subclasses set list_cache_name and build the
+    list data in get_list_data(); the cache is invalidated by accounts.signals.
+    """
+    list_cache_name = None
+
+    def get_list_data(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        etag, data = get_cached_reference(self.list_cache_name, self.get_list_data)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+
+class CityViewSet(CachedListMixin, viewsets.ModelViewSet):
+    queryset = City.objects.select_related('region')
     serializer_class = CitySerializer
+    list_cache_name = 'cities'
 
+    def get_list_data(self):
+        # Same shape as CitySerializer, built from one flat query instead of a nested
+        # RegionSerializer per city.
+        return [
+            {'id': pk, 'name': name, 'region': {'id': region_id, 'name': region_name}}
+            for pk, name, region_id, region_name in City.objects.order_by('pk').values_list(
+                'id', 'name', 'region_id', 'region__name')
+        ]
 
-class RegionViewSet(viewsets.ModelViewSet):
+
+class RegionViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = Region.objects.all()
     serializer_class = RegionSerializer
+    list_cache_name = 'regions'
+
+    def get_list_data(self):
+        return list(Region.objects.order_by('pk').values('id', 'name'))
+
+
+def courier_route_response(request, courier):
+    """
+    The optimized visiting order of courier's open products (see accounts/routing.py),
+    starting from ?lat=&lng= when given, with an ETag; 304 when the client has it already.
+    """
+    params = RouteParamsSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    start = None
+    if 'lat' in params.validated_data:
+        # Rounded to about 100 m, so that routes requested from nearby positions share the cache.
+        start = (round(params.validated_data['lat'], 3), round(params.validated_data['lng'], 3))
+    etag, route = courier_route(courier, start)
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(route, headers={'ETag': etag})
 
 
 class CourierViewSet(viewsets.ModelViewSet):
@@ -129,6 +226,13 @@ class CourierViewSet(viewsets.ModelViewSet):
         if self.request.user.role == 'Courier Boss':
             serializer.save()
 
+    @action(detail=True, methods=['get'], renderer_classes=[ORJSONRenderer, BrowsableAPIRenderer])
+    def route(self, request, pk=None):
+        """
+        The optimized delivery route of the courier's open products.
+        """
+        return courier_route_response(request, self.get_object())
+
 
 class CourierCreateAPIView(generics.CreateAPIView):
     """
@@ -138,10 +242,66 @@ class CourierCreateAPIView(generics.CreateAPIView):
     serializer_class = CourierCreateSerializer
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductFastListMixin:
+    """
+    Lists products through the read-only fast path (product_list_values) instead of
+    ProductSerializer instances, rendered with orjson. The response is byte for byte
+    what ProductSerializer and JSONRenderer would produce.
+
+    Responses carry an ETag (see product_list_etag); a conditional GET for an unchanged
+    list is answered 304 without querying the product table. What a list holds depends on
+    who asks (a courier sees their own products), so the ETag varies on the user and the
+    responses on the Authorization header.
+
+    ?fields=id,order_number,... limits the response (and the selected columns) to those
+    ProductSerializer fields.
+    """
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        fields = parse_product_fields(request.query_params.get('fields'))
+        queryset = self.filter_queryset(self.get_queryset())
+        # Read before the rows, so a write committed meanwhile can only make the ETag older
+        # than the data, never newer.
+        etag = product_list_etag(request.user.pk, request.get_full_path(), request.accepted_renderer.format)
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+            patch_vary_headers(response, ['Authorization'])
+            return response
+
+        drop = []
+        if fields is not None:
+            # Keyset pagination needs its ordering columns from the last row.
+            ordering = []
+            if self.paginator is not None:
+                ordering = [name.lstrip('-') for name in self.paginator.get_ordering(request, queryset, self)]
+            drop = [name for name in ordering if name not in fields]
+            fields = fields + drop
+
+        queryset = product_list_values(queryset, fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(product_list_rows(page, drop))
+        else:
+            response = Response(product_list_rows(list(queryset), drop))
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+class ProductViewSet(ProductFastListMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('region', 'city')
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrCourierBoss]
+    pagination_class = ProductKeysetPagination
+    filter_backends = [ProductFilterBackend, ProductOrderingFilter]
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<file_format>csv|xlsx)')
+    def export(self, request, file_format):
+        """
+        Downloads every product matching the list filters as CSV or XLSX.
+        """
+        return export_products_response(self.filter_queryset(self.get_queryset()), file_format)
 
     def perform_create(self, serializer):
         if self.request.user.role == 'Courier Boss':
@@ -164,17 +324,90 @@ class AssignProductView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkAssignProductView(APIView):
+    """
+    Assigns many products to one courier in a single UPDATE.
+    Expects a POST request with JSON:
+      { "courier": <id>, "product_ids": [<id>, ...] }
+    or, to assign every product matching the filters of the product list:
+      { "courier": <id>, "filter": { "city": <id>, "assigned": "unassigned", ... } }
+    Only open products (see order_status.OPEN_STATUSES) are assigned: delivered and cancelled
+    ones keep their courier, and those among product_ids are returned as "skipped".
+    Nothing is assigned unless the courier covers the city of every open product (products
+    without a city are allowed, as in ProductSerializer) and, with product_ids, every id exists.
+    """
+    permission_classes = [IsCourierBoss]
+
+    def post(self, request, *args, **kwargs):
+        serializer = BulkAssignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        courier = serializer.validated_data['courier']
+        covered = set(courier.covered_cities.values_list('id', flat=True))
+
+        skipped = []
+        if 'product_ids' in serializer.validated_data:
+            product_ids = set(serializer.validated_data['product_ids'])
+            rows = Product.objects.filter(id__in=product_ids).values_list('id', 'city_id', 'order_status')
+            cities = {pk: city_id for pk, city_id, _ in rows}
+            missing = sorted(product_ids - cities.keys())
+            if missing:
+                return Response({"product_ids": [f"Products not found: {missing}."]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            skipped = sorted(pk for pk, _, state in rows if state not in order_status.OPEN_STATUSES)
+            for pk in skipped:
+                del cities[pk]
+            products = Product.objects.filter(id__in=cities, order_status__in=order_status.OPEN_STATUSES)
+            uncovered = sorted(pk for pk, city_id in cities.items() if city_id is not None and city_id not in covered)
+            if uncovered:
+                return Response({"detail": "The courier does not cover the delivery city of some products.",
+                                 "product_ids": uncovered}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            products = Product.objects.filter(
+                **product_filter_lookups(serializer.validated_data['filter']),
+                order_status__in=order_status.OPEN_STATUSES,
+            )
+            cities = set(products.exclude(city=None).order_by().values_list('city_id', flat=True).distinct())
+            if cities - covered:
+                return Response({"detail": "The courier does not cover the delivery city of some products.",
+                                 "cities": sorted(cities - covered)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The coverage and status conditions are part of the UPDATE so that a product moved to
+        # another city or delivered since the check can't end up with this courier.
+        updated = products.filter(Q(city=None) | Q(city__in=covered)).exclude(assigned_to=courier).update(
+            assigned_to=courier)
+        return Response({"updated": updated, "skipped": skipped}, status=status.HTTP_200_OK)
+
+
+class AutoAssignProductView(APIView):
+    """
+    Assigns the unassigned open products to couriers covering their city, balancing the
+    couriers' open workload (see accounts/assignment.py).
+    Expects a POST request with optional JSON:
+      { "filter": { "region": <id>, ... }, "dry_run": false }
+    and returns the number of products assigned, left uncovered and the couriers that got work.
+    """
+    permission_classes = [IsCourierBoss]
+
+    def post(self, request, *args, **kwargs):
+        serializer = AutoAssignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        products = Product.objects.filter(**product_filter_lookups(serializer.validated_data.get('filter', {})))
+        result = auto_assign_products(products, dry_run=serializer.validated_data['dry_run'])
+        return Response(result, status=status.HTTP_200_OK)
+
+
 def home(request):
     return HttpResponse("Welcome to my Django project!")
 
 
-class CourierProductListView(generics.ListAPIView):
+class CourierProductListView(ProductFastListMixin, generics.ListAPIView):
     """
     Returns a list of Products assigned to the authenticated courier.
     Assumes that the courier is linked to the user (i.e. Courier.user).
     """
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProductKeysetPagination
 
     def get_queryset(self):
         try:
@@ -182,7 +415,68 @@ class CourierProductListView(generics.ListAPIView):
             courier = Courier.objects.get(user=self.request.user)
         except Courier.DoesNotExist:
             return Product.objects.none()
-        return Product.objects.filter(assigned_to=courier)
+        return Product.objects.filter(assigned_to=courier).select_related('region', 'city')
+
+
+class CourierRouteView(APIView):
+    """
+    The optimized delivery route of the authenticated courier's open products. GET with
+    ?lat=<latitude>&lng=<longitude> (the courier's position, optional) returns the products
+    with coordinates as "stops" in visiting order, the route's "distance_km" and the ids of
+    the products without coordinates as "unrouted".
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            courier = Courier.objects.get(user=request.user)
+        except Courier.DoesNotExist:
+            return Response({"detail": "You are not authorized as a courier."}, status=status.HTTP_403_FORBIDDEN)
+        return courier_route_response(request, courier)
+
+
+class CourierProductChangesView(APIView):
+    """
+    Delta sync for the courier app. GET with ?since=<cursor from the previous call> returns
+    the courier's products added or changed since then, the ids of products that left the
+    courier's list (reassigned, unassigned or deleted) and the cursor for the next call.
+    Without since, every product assigned to the courier is returned.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            courier = Courier.objects.get(user=request.user)
+        except Courier.DoesNotExist:
+            return Response({"detail": "You are not authorized as a courier."}, status=status.HTTP_403_FORBIDDEN)
+
+        since = None
+        if request.query_params.get('since'):
+            try:
+                since, = decode_cursor(request.query_params['since'])
+                since = int(since)
+            except (TypeError, ValueError):
+                raise NotFound("Invalid cursor")
+
+        # Every revision up to the committed counter value is visible, so nothing below
+        # the returned cursor can still show up later.
+        until = current_product_revision()
+        products = Product.objects.filter(assigned_to=courier, revision__lte=until)
+        if since is not None:
+            products = products.filter(revision__gt=since)
+        changed = product_list_rows(list(product_list_values(products).order_by('revision', 'id')))
+
+        removed = []
+        if since is not None:
+            changed_ids = {row['id'] for row in changed}
+            removed = sorted(
+                set(courier.product_removals.filter(revision__gt=since, revision__lte=until).values_list(
+                    'product_id', flat=True)) - changed_ids
+            )
+
+        return Response({'changed': changed, 'removed': removed, 'next': encode_cursor([until])})
 
 
 class ConfirmDeliveredProductView(APIView):
@@ -210,11 +504,12 @@ class ConfirmDeliveredProductView(APIView):
             return Response({"detail": "You are not assigned to this product."}, status=status.HTTP_403_FORBIDDEN)
 
         # Only allow confirming delivery if the product is already marked as Received.
-        if product.order_status != "Received":
+        if product.order_status != order_status.RECEIVED:
             return Response({"detail": "Product must be received first."}, status=status.HTTP_400_BAD_REQUEST)
 
-        product.order_status = "Delivered"
-        product.save()
+        if not order_status.transition_product(product, order_status.DELIVERED):
+            return Response({"detail": "Product status was changed meanwhile, please retry."},
+                            status=status.HTTP_409_CONFLICT)
         return Response({"detail": "Product delivery confirmed."}, status=status.HTTP_200_OK)
 
 
@@ -242,6 +537,71 @@ class ConfirmReceiptProductView(APIView):
             return Response({"detail": "You are not assigned to this product."}, status=status.HTTP_403_FORBIDDEN)
 
         # Update status to Received.
-        product.order_status = "Received"
-        product.save()
+        try:
+            changed = order_status.transition_product(product, order_status.RECEIVED)
+        except order_status.InvalidTransition as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not changed:
+            return Response({"detail": "Product status was changed meanwhile, please retry."},
+                            status=status.HTTP_409_CONFLICT)
         return Response({"detail": "Product receipt confirmed."}, status=status.HTTP_200_OK)
+
+
+class BulkProductTransitionView(APIView):
+    """
+    Moves a batch of the courier's products to target_status with a single conditional
+    UPDATE (only rows assigned to the courier whose status may move to target_status, and
+    is in from_statuses when set, change).
+    Expects a POST request with JSON:
+      { "product_ids": [<id>, ...] }
+    and returns the outcome for every id, in request order: "ok", "not_assigned" (unknown
+    or someone else's product) or "wrong_state".
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    target_status = None
+    from_statuses = None
+
+    def post(self, request, *args, **kwargs):
+        serializer = ProductIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_ids = list(dict.fromkeys(serializer.validated_data['product_ids']))
+
+        try:
+            courier = Courier.objects.get(user=request.user)
+        except Courier.DoesNotExist:
+            return Response({"detail": "You are not authorized as a courier."}, status=status.HTTP_403_FORBIDDEN)
+
+        with transaction.atomic():
+            revision = next_product_revision()
+            updated = order_status.transition(
+                Product.objects.filter(id__in=product_ids, assigned_to=courier),
+                self.target_status, self.from_statuses, revision=revision,
+            )
+            # Rows carrying this revision are exactly the ones the update changed.
+            found = {
+                pk: (assigned_to_id, row_revision)
+                for pk, assigned_to_id, row_revision in Product.objects.filter(id__in=product_ids).values_list(
+                    'id', 'assigned_to_id', 'revision')
+            }
+
+        results = []
+        for pk in product_ids:
+            assigned_to_id, row_revision = found.get(pk, (None, None))
+            if assigned_to_id != courier.pk:
+                outcome = 'not_assigned'
+            elif row_revision == revision:
+                outcome = 'ok'
+            else:
+                outcome = 'wrong_state'
+            results.append({'product_id': pk, 'outcome': outcome})
+        return Response({'updated': updated, 'results': results}, status=status.HTTP_200_OK)
+
+
+class BulkConfirmReceiptView(BulkProductTransitionView):
+    target_status = order_status.RECEIVED
+
+
+class BulkConfirmDeliveredView(BulkProductTransitionView):
+    target_status = order_status.DELIVERED
+    # Couriers deliver only what they have received.
+    from_statuses = (order_status.RECEIVED,)
@@ -206,3 +206,37 @@ CSP_OBJECT_SRC = ("'none'",)
 
 # Upgrade insecure requests (forces HTTPS)
 CSP_UPGRADE_INSECURE_REQUESTS = True
+
+# Background product imports (see accounts/jobs.py)
+IMPORT_JOB_WORKERS = 2
+# Normalize import chunks with pandas column operations instead of row by row.
+IMPORT_VECTORIZED = False
+# Seconds without a checkpoint after which another import may take over a file's journal
+# from an import that claimed it (e.g. one that died with its process).
+IMPORT_CLAIM_TIMEOUT = 600
+
+# Default page size of the keyset-paginated product lists (see accounts/pagination.py).
+PRODUCT_PAGE_SIZE = 100
+
+# Automatic courier assignment (see accounts/assignment.py): a parcel of this many kilograms
+# weighs on a courier's workload as much as one extra parcel.
+AUTO_ASSIGN_WEIGHT_UNIT = 5
+
+# Courier route optimization (see accounts/routing.py): seconds of 2-opt improvement per route,
+# and how long an unchanged route stays in the default cache.
+ROUTE_TIME_BUDGET = 0.3
+ROUTE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Cache for the Region and City list endpoints (and the reference generation in product list
+# ETags). Invalidation only reaches the process that made the change unless
+# REFERENCE_CACHE_ALIAS points at a shared backend (e.g. Redis); with the per-process LocMem
+# default, other workers pick up a change when their entries expire after
+# REFERENCE_CACHE_TIMEOUT seconds. Multi-process deployments should use a shared backend.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reference-data',
+    }
+}
+REFERENCE_CACHE_ALIAS = 'default'
+REFERENCE_CACHE_TIMEOUT = 300